@@ -0,0 +1,207 @@
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINES = ("http", "navegador", "script", "paralelo")
+
+
+def load_script(file_name, module_name):
+    """Importa uno de los scripts del proyecto (sus nombres tienen espacios)"""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(BASE_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+registro = load_script("Registro de datos.py", "registro_de_datos")
+simulado = load_script("Servidor SCP simulado.py", "servidor_scp_simulado")
+
+
+def generate_records(count, fechas=5, seed=0):
+    """
+    Registros sintéticos con el formato del extractor
+
+    Args:
+        count (int): Número de registros
+        fechas (int): Fechas distintas entre las que se reparten
+        seed (int): Semilla para repetir la misma carga
+
+    Returns:
+        list: Registros
+    """
+    rng = random.Random(seed)
+    dates = [f"25-05-{day:02d}" for day in range(1, fechas + 1)]
+    records = []
+    for i in range(count):
+        fecha = dates[i * len(dates) // count]
+        records.append({
+            "fecha": fecha,
+            "OP": rng.choice([7027, 7031, 7045, 7102, 7110, 7203]),
+            "operario": rng.choice(simulado.DEFAULT_OPERARIOS),
+            "actividad": f"ACTIVIDAD DE PRUEBA {i + 1}",
+            "tiempo_ordinario": str(rng.choice([1.0, 1.5, 2.0, 2.5, 3.0])),
+            "tiempo_extra": "0",
+            "equipo": "30",
+        })
+    return records
+
+
+def percentile(values, pct):
+    """Percentil por rango más cercano"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_engine(engine, records, url, args):
+    """
+    Registra `records` con un motor por el mismo punto de entrada que main() de
+    "Registro de datos.py": JSON en disco, libro de envíos nuevo y prevalidación
+
+    Returns:
+        list: Resultados por registro ({"ok", "segundos", ...})
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_file = os.path.join(tmp_dir, "registros.json")
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+        ledger = registro.SubmissionLedger(os.path.join(tmp_dir, "registro_envios.sqlite3"))
+        validate = not args.sin_prevalidar
+        try:
+            if engine == "http":
+                submitter = registro.HttpFormSubmitter(
+                    form_url=url.replace("acceso.logIn", "registro"),
+                    op_options_url=url.replace("acceso.logIn", "registro.ops") + "&fecha={fecha}",
+                    workers=args.workers,
+                )
+                try:
+                    if not submitter.login(url, "admin", "123"):
+                        raise RuntimeError("login fallido")
+                    return submitter.process_all_records(json_file, ledger=ledger, validate=validate)
+                finally:
+                    submitter.close()
+
+            browser_options = {"fast": True, "driver_path": args.driver}
+            if engine == "paralelo":
+                return registro.run_parallel_sessions(
+                    registro.load_json_records(json_file), url, "admin", "123", sessions=args.sesiones,
+                    ledger=ledger, validate=validate, browser_options=browser_options,
+                )
+
+            fill_engine = "script" if engine == "script" else "teclado"
+            automation = registro.FormAutomation(fill_engine=fill_engine, headless=True, **browser_options)
+            try:
+                if not automation.login(url, "admin", "123"):
+                    raise RuntimeError("login fallido")
+                return automation.process_all_records(json_file, ledger=ledger, validate=validate)
+            finally:
+                automation.close()
+        finally:
+            ledger.close()
+
+
+def benchmark(engine, records, args):
+    """
+    Mide un motor contra un SCP simulado nuevo
+
+    Returns:
+        dict: Métricas del motor
+    """
+    scp = simulado.ScpSimulado.from_records(records, latency=args.latencia / 1000)
+    server, url = simulado.start_server(scp)
+    start = time.perf_counter()
+    try:
+        results = run_engine(engine, records, url, args)
+        error = None
+    except Exception as e:
+        results, error = [], str(e)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+
+    latencies = [result["segundos"] for result in results if result and result.get("segundos") is not None]
+    ok = sum(1 for result in results if result and result["ok"])
+    return {
+        "motor": engine,
+        "registros": len(records),
+        "exitosos": ok,
+        "fallidos": len(records) - ok,
+        "registrados_en_servidor": scp.stats()["registros"],
+        "segundos": round(elapsed, 2),
+        "registros_por_minuto": round(ok / elapsed * 60, 1) if elapsed else None,
+        "p50_segundos": percentile(latencies, 50),
+        "p95_segundos": percentile(latencies, 95),
+        "error": error,
+    }
+
+
+def print_table(rows):
+    print(f"\n{'Motor':<10} {'OK':>6} {'Fallos':>7} {'Reg/min':>9} {'p50 (s)':>9} {'p95 (s)':>9}")
+    print("-" * 54)
+    for row in rows:
+        if row["error"]:
+            print(f"{row['motor']:<10} no disponible: {row['error']}")
+            continue
+        p50 = "-" if row["p50_segundos"] is None else f"{row['p50_segundos']:.3f}"
+        p95 = "-" if row["p95_segundos"] is None else f"{row['p95_segundos']:.3f}"
+        print(
+            f"{row['motor']:<10} {row['exitosos']:>6} {row['fallidos']:>7} "
+            f"{row['registros_por_minuto']:>9} {p50:>9} {p95:>9}"
+        )
+
+
+def parse_args():
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Mide la velocidad del registro contra el SCP simulado")
+    parser.add_argument("--registros", type=int, default=100, help="Registros sintéticos (por defecto 100)")
+    parser.add_argument("--json", help="Usar los registros de un JSON del extractor")
+    parser.add_argument("--fechas", type=int, default=5, help="Fechas distintas en los registros sintéticos")
+    parser.add_argument("--motores", default="http",
+                        help=f"Motores separados por coma: {', '.join(ENGINES)} (por defecto http)")
+    parser.add_argument("--latencia", type=float, default=20.0,
+                        help="Latencia del servidor en milisegundos (por defecto 20)")
+    parser.add_argument("--workers", type=int, default=4, help="Peticiones simultáneas del motor http")
+    parser.add_argument("--sesiones", type=int, default=4, help="Navegadores del motor paralelo")
+    parser.add_argument("--driver", help="Ruta a chromedriver para los motores de navegador")
+    parser.add_argument("--sin-prevalidar", action="store_true",
+                        help="No validar los registros contra las opciones del formulario antes de enviar")
+    parser.add_argument("--salida", default="output", help="Directorio del reporte")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    engines = [engine.strip() for engine in args.motores.split(",") if engine.strip()]
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        raise SystemExit(f"Motores desconocidos: {', '.join(unknown)}")
+
+    if args.json:
+        records = registro.load_json_records(args.json)
+    else:
+        records = generate_records(args.registros, args.fechas)
+
+    rows = []
+    for engine in engines:
+        print(f"\n=== {engine}: {len(records)} registros, latencia {args.latencia} ms ===")
+        rows.append(benchmark(engine, records, args))
+    print_table(rows)
+
+    os.makedirs(args.salida, exist_ok=True)
+    report_path = os.path.join(args.salida, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({"fecha": datetime.now().isoformat(), "latencia_ms": args.latencia, "resultados": rows},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\nReporte guardado en: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,212 +1,1720 @@
+import numpy as np
 import pandas as pd
+import argparse
+import glob
+import gzip
+import hashlib
 import json
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 import os
+import re
+import threading
+import unicodedata
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv
+from openpyxl import load_workbook
 
 load_dotenv()
 
+DEFAULT_MODEL = "gpt-4.1-2025-04-14"
+MAX_COMPLETION_TOKENS = 2000
+# Tokens estimados de respuesta por fila de la tabla (un objeto JSON por fila)
+OUTPUT_TOKENS_PER_ROW = 80
+# Fracción de max_tokens que se planifica usar, para dejar margen a la estimación
+OUTPUT_BUDGET_RATIO = 0.75
+ROWS_PER_CHUNK = max(1, int(MAX_COMPLETION_TOKENS * OUTPUT_BUDGET_RATIO) // OUTPUT_TOKENS_PER_ROW)
+# Incrementar cuando cambie el prompt para invalidar la caché de extracción
+PROMPT_VERSION = "3"
+CACHE_DIR = os.path.join(".cache", "extraccion")
+# Subdirectorio de la caché de extracción con el texto de las hojas de cada libro
+WORKBOOK_CACHE_SUBDIR = "libros"
+WORKBOOK_CACHE_DIR = os.path.join(CACHE_DIR, WORKBOOK_CACHE_SUBDIR)
+MANIFEST_FILE = "manifest.json"
+METRICS_DIR = "metricas"
+COMPACTED_DIR = "compactados"
+# Errores transitorios de la API que se reintentan con espera exponencial
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+
+
+# Instrucciones fijas del prompt: van primero y sin datos de la hoja para que el
+# prefijo sea idéntico en todas las solicitudes (caché de prompts de OpenAI)
+SYSTEM_PROMPT = """Extraes registros de hojas de producción de Excel. La hoja llega como filas con celdas separadas por tabulaciones; las columnas vacías ya se eliminaron y en las filas anteriores a la tabla se omiten las celdas vacías.
+
+REGLAS:
+1. FECHA: busca "FECHA:" (DIA/MES/AÑO o AAAA-MM-DD) y conviértela a YY-MM-DD (2025-04-03 → 25-04-03).
+2. OPERARIO: el nombre que sigue a "NOMBRE:" (ej: "NELSON RANGEL").
+3. Crea un objeto por cada fila de la tabla OP / DESCRIPCION / TIEMPO / EXTRAS.
+   - Si la celda OP tiene varios números separados por "-" o "/" (ej: 7027-7028-7029), "OP" es la lista [7027, 7028, 7029].
+   - Devuelve el TIEMPO y los EXTRAS totales de la fila, sin repartirlos entre las OPs.
+4. CAMPOS:
+   - fecha: formato YY-MM-DD
+   - OP: número entero (3, no 3.0) o lista de números
+   - operario: nombre completo
+   - actividad: descripción de la actividad
+   - tiempo_ordinario: tiempo total de la fila como string (ej: "1.5")
+   - tiempo_extra: "0" si no hay tiempo extra
+   - equipo: el valor de EQUIPO indicado con la hoja
+
+EJEMPLO: la fila "7027/7028/7029\tREUNION DE SEGUIMIENTO ECOPETROL\t1,5" de una hoja con FECHA 2025-04-03, NOMBRE NELSON RANGEL y EQUIPO 30 produce:
+[{"fecha": "25-04-03", "OP": [7027, 7028, 7029], "operario": "Nelson Rangel", "actividad": "REUNION DE SEGUIMIENTO ECOPETROL", "tiempo_ordinario": "1.5", "tiempo_extra": "0", "equipo": "30"}]
+
+Responde ÚNICAMENTE con el arreglo JSON válido, sin texto adicional."""
+
+# Tamaño mínimo del prefijo para que OpenAI lo guarde en su caché de prompts
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# Plantilla de la versión 2 del prompt (instrucciones y hoja en un solo mensaje);
+# solo se usa como referencia "antes" en el reporte de tokens
+PROMPT_V2_TEMPLATE = """Analiza esta hoja de producción Excel y extrae los datos según las siguientes reglas:
+
+CONTENIDO DE LA HOJA:
+{sheet_text}
+
+REGLAS DE EXTRACCIÓN:
+
+1. FECHA: 
+   - Busca patrones como "FECHA: DIA/MES/AÑO" 
+   - Convierte a formato YY-MM-DD (ej: 2025-04-03 → 25-04-03)
+
+2. OPERARIO:
+   - Busca "NOMBRE:" seguido del nombre:
+   - Extrae solo el nombre (ej: "NELSON RANGEL")
+
+3. OPs y DATOS:
+   - Busca líneas con OP, DESCRIPCION, TIEMPO
+   - Crea un objeto por cada fila de la tabla
+   - Si la celda OP tiene múltiples números separados por "-" o "/" (ej: 7027-7028-7029), devuelve "OP" como lista [7027, 7028, 7029]
+   - Devuelve el TIEMPO y los EXTRAS totales de la fila, sin repartirlos entre las OPs
+
+4. CAMPOS REQUERIDOS:
+   - fecha: formato YY-MM-DD
+   - OP: número de la OP (int → ejemplo: 3 : no debe ser 3.0) o lista de números
+   - operario: nombre en formato "Nombre completo"
+   - actividad: descripción de la actividad
+   - tiempo_ordinario: tiempo total de la fila en formato string (ej: "1.5")
+   - tiempo_extra: "0" si no hay tiempo extra especificado
+   - equipo: "{equipo}"
+
+EJEMPLO DE PROCESAMIENTO:
+Si encuentras: "7027/7028/7029 REUNION DE SEGUIMIENTO ECOPETROL 1,5"
+Debes crear un solo objeto con las 3 OPs y el tiempo total 1.5
+
+FORMATO DE RESPUESTA (JSON válido):
+[
+  {{
+    "fecha": "25-04-03",
+    "OP": [7027, 7028, 7029],
+    "operario": "Nelson Rangel",
+    "actividad": "REUNION DE SEGUIMIENTO ECOPETROL",
+    "tiempo_ordinario": "1.5",
+    "tiempo_extra": "0",
+    "equipo": "{equipo}"
+  }}
+]
+
+Responde ÚNICAMENTE con el JSON válido, sin texto adicional."""
+
+MIDNIGHT_SUFFIX_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}) 00:00:00$")
+WHOLE_NUMBER_RE = re.compile(r"^(\d+)\.0+$")
+
+
+def estimate_tokens(text):
+    """
+    Estimación rápida de tokens (~4 caracteres por token)
+    
+    Args:
+        text (str): Texto a estimar
+        
+    Returns:
+        int: Número aproximado de tokens
+    """
+    return len(text) // 4 + 1
+
+
+def clean_json_response(text):
+    """
+    Quita los bloques de código markdown (```json) de una respuesta
+    
+    Args:
+        text (str): Respuesta del modelo
+        
+    Returns:
+        str: Texto JSON
+    """
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text.replace("```json", "").replace("```", "").strip()
+    if text.startswith("```"):
+        text = text.replace("```", "").strip()
+    return text
+
+
+class JsonArrayStreamParser:
+    def __init__(self):
+        """
+        Parser incremental de un arreglo JSON de objetos
+        
+        Recibe la respuesta por fragmentos y devuelve cada objeto de nivel
+        superior en cuanto se cierra su llave. El texto fuera de los objetos
+        (corchetes, comas, bloques ```json) se ignora, y un objeto mal formado
+        no invalida los anteriores.
+        """
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.errors = 0
+
+    @property
+    def pending(self):
+        """True si hay un objeto empezado sin cerrar (respuesta cortada)"""
+        return self._depth > 0
+
+    def feed(self, text):
+        """
+        Procesa un fragmento de texto
+        
+        Args:
+            text (str): Fragmento de la respuesta
+            
+        Returns:
+            list: Objetos completados en este fragmento
+        """
+        objects = []
+        for char in text:
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+            
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        objects.append(json.loads("".join(self._buffer)))
+                    except json.JSONDecodeError:
+                        self.errors += 1
+                    self._buffer = []
+        return objects
+
+
+def normalize_sheet_text(sheet_text):
+    """
+    Normaliza el texto de una hoja (celdas recortadas, sin filas vacías)
+    
+    Args:
+        sheet_text (str): Texto de la hoja separado por tabulaciones
+        
+    Returns:
+        str: Texto normalizado
+    """
+    lines = []
+    for line in sheet_text.splitlines():
+        cells = [cell.strip() for cell in line.split("\t")]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            lines.append("\t".join(cells))
+    return "\n".join(lines)
+
+
+OP_NUMBER_RE = re.compile(r"^\d+(?:\.0+)?$")
+OP_SEPARATOR_RE = re.compile(r"\s*[-/,;]\s*")
+ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T]\d{1,2}:\d{2}(?::\d{2})?)?$")
+DMY_DATE_RE = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-](\d{2}|\d{4})$")
+
+
+def _plain(text):
+    """Texto en mayúsculas y sin tildes para comparar etiquetas"""
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).upper().strip()
+
+
+def parse_sheet_date(value):
+    """
+    Convierte una fecha de la hoja a formato YY-MM-DD
+    
+    Args:
+        value (str): Fecha como "3/4/2025", "03-04-25" o "2025-04-03 00:00:00"
+        
+    Returns:
+        str: Fecha YY-MM-DD o None si no es válida
+    """
+    value = value.strip()
+    match = ISO_DATE_RE.match(value)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+    else:
+        match = DMY_DATE_RE.match(value)
+        if not match:
+            return None
+        day, month, year = (int(g) for g in match.groups())
+        if year < 100:
+            year += 2000
+    try:
+        return datetime(year, month, day).strftime("%y-%m-%d")
+    except ValueError:
+        return None
+
+
+def parse_hours(value):
+    """
+    Convierte un tiempo de la hoja a horas ("1,5" → 1.5)
+    
+    Args:
+        value (str): Texto de la celda
+        
+    Returns:
+        float: Horas o None si no es un número válido
+    """
+    try:
+        hours = float(value.strip().replace(",", "."))
+    except ValueError:
+        return None
+    return hours if hours >= 0 else None
+
+
+def split_ops(value):
+    """
+    Separa una celda de OP con varios números ("7027-7028" o "7027/7028")
+    
+    Args:
+        value (str): Texto de la celda
+        
+    Returns:
+        list: Números de OP o None si la celda no contiene solo números
+    """
+    parts = [part for part in OP_SEPARATOR_RE.split(value.strip()) if part]
+    if not parts or not all(OP_NUMBER_RE.match(part) for part in parts):
+        return None
+    return [int(float(part)) for part in parts]
+
+
+def parse_op_value(op):
+    """
+    Normaliza el campo OP de un registro a una lista de enteros
+    
+    Args:
+        op: Entero, número, lista de números o texto "7027-7028"
+        
+    Returns:
+        list: Números de OP o None si el valor no es válido
+    """
+    if isinstance(op, (list, tuple)):
+        ops = [parse_op_value(o) for o in op]
+        if not ops or any(o is None for o in ops):
+            return None
+        return [o for sublist in ops for o in sublist]
+    if isinstance(op, bool) or op is None:
+        return None
+    if isinstance(op, (int, float)):
+        return [int(op)] if float(op).is_integer() else None
+    return split_ops(str(op))
+
+
+def allocate_times(totals, counts):
+    """
+    Reparte tiempos de grupos entre sus OPs en incrementos de 0.5 (vectorizado)
+    
+    Cada grupo recibe una división equilibrada que suma exactamente su total
+    redondeado a 0.5; las porciones mayores van al final (8.5 / 3 → 2.5, 3, 3).
+    Si el total no alcanza para todas las OPs, las primeras reciben 0
+    (1.0 / 3 → 0, 0.5, 0.5).
+    
+    Args:
+        totals (array-like): Tiempo total de cada grupo
+        counts (array-like): Número de OPs de cada grupo
+        
+    Returns:
+        numpy.ndarray: Tiempos por OP, grupo tras grupo
+    """
+    totals = np.asarray(totals, dtype=float)
+    counts = np.asarray(counts, dtype=int)
+    if counts.size == 0:
+        return np.zeros(0)
+    
+    units = np.rint(totals * 2).astype(int)
+    base, remainder = np.divmod(units, counts)
+    
+    group = np.repeat(np.arange(counts.size), counts)
+    starts = np.cumsum(counts) - counts
+    position = np.arange(counts.sum()) - starts[group]
+    larger = position >= (counts - remainder)[group]
+    
+    return (base[group] + larger) / 2
+
+
+def expand_time_groups(rows):
+    """
+    Convierte filas con una o varias OPs y tiempos totales en registros por OP
+    
+    Args:
+        rows (list): Registros cuyo "OP" puede ser entero, lista o texto "7027-7028";
+            tiempo_ordinario y tiempo_extra son el total de la fila
+            
+    Returns:
+        list: Un registro por OP con los tiempos repartidos. Las filas cuya OP no
+            es un número (o lista de números) se omiten con una advertencia, y en
+            filas con varias OPs se omiten las que quedan sin tiempo
+    """
+    valid_rows, ops_per_row = [], []
+    for row in rows:
+        ops = parse_op_value(row.get("OP"))
+        if ops is None:
+            print(f"⚠️ Fila omitida: OP no válida ({row.get('OP')!r}) en '{row.get('actividad', '')}'")
+            continue
+        valid_rows.append(row)
+        ops_per_row.append(ops)
+    
+    counts = [len(ops) for ops in ops_per_row]
+    ordinarios = allocate_times([row["tiempo_ordinario"] for row in valid_rows], counts)
+    extras = allocate_times([row["tiempo_extra"] for row in valid_rows], counts)
+    
+    records = []
+    index = 0
+    for row, ops in zip(valid_rows, ops_per_row):
+        for op in ops:
+            ordinario, extra = ordinarios[index], extras[index]
+            index += 1
+            # Sin porción de tiempo no hay nada que registrar; la suma de la fila se conserva
+            if len(ops) > 1 and not ordinario and not extra:
+                continue
+            record = dict(row)
+            record["OP"] = op
+            record["tiempo_ordinario"] = str(float(ordinario))
+            record["tiempo_extra"] = format_hours(extra)
+            records.append(record)
+    return records
+
+
+def format_hours(hours):
+    """Formato de tiempo usado en los registros ("0" sin tiempo, "2.5", "3.0")"""
+    return str(float(hours)) if hours else "0"
+
+
+def _is_table_header(plain_cells):
+    """Indica si una fila es el encabezado OP / DESCRIPCION / TIEMPO"""
+    return "OP" in plain_cells and "DESCRIPCION" in plain_cells and "TIEMPO" in plain_cells
+
+
+def split_sheet_sections(sheet_text):
+    """
+    Separa una hoja en contexto (encabezado con FECHA/NOMBRE y fila de títulos)
+    y filas de datos, para poder dividirla en bloques
+    
+    Args:
+        sheet_text (str): Texto de la hoja separado por tabulaciones
+        
+    Returns:
+        tuple: (lineas_contexto, lineas_datos)
+    """
+    lines = sheet_text.splitlines()
+    for index, line in enumerate(lines):
+        if _is_table_header([_plain(cell) for cell in line.split("\t")]):
+            return lines[:index + 1], lines[index + 1:]
+    
+    # Sin tabla reconocible: el contexto son las líneas con etiquetas NOMBRE/FECHA
+    context, data = [], []
+    for line in lines:
+        plain = _plain(line)
+        (context if "NOMBRE" in plain or "FECHA" in plain else data).append(line)
+    return context, data
+
+
+def _compact_cell(cell):
+    """Celda sin espacios sobrantes, fechas sin hora 00:00:00 y enteros sin .0"""
+    cell = re.sub(r"\s{2,}", " ", cell.strip())
+    match = MIDNIGHT_SUFFIX_RE.match(cell) or WHOLE_NUMBER_RE.match(cell)
+    return match.group(1) if match else cell
+
+
+def encode_sheet_compact(sheet_text):
+    """
+    Codificación compacta de una hoja para el prompt: sin filas ni columnas
+    vacías y, antes de la tabla, sin celdas vacías. Las filas de la tabla
+    conservan sus celdas vacías para no desalinear las columnas.
+    
+    Args:
+        sheet_text (str): Texto de la hoja separado por tabulaciones
+        
+    Returns:
+        str: Texto compacto
+    """
+    rows = [[_compact_cell(cell) for cell in line.split("\t")] for line in sheet_text.splitlines()]
+    rows = [row for row in rows if any(row)]
+    width = max((len(row) for row in rows), default=0)
+    used = [i for i in range(width) if any(i < len(row) and row[i] for row in rows)]
+    header_index = next(
+        (n for n, row in enumerate(rows) if _is_table_header([_plain(cell) for cell in row])), None
+    )
+    
+    lines = []
+    for n, row in enumerate(rows):
+        cells = [row[i] if i < len(row) else "" for i in used]
+        if header_index is not None and n < header_index:
+            cells = [cell for cell in cells if cell]
+        while cells and not cells[-1]:
+            cells.pop()
+        lines.append("\t".join(cells))
+    return "\n".join(lines)
+
+
+def merge_chunk_rows(chunks):
+    """
+    Une las filas extraídas de los bloques de una hoja. El contexto repetido en
+    cada bloque solo contiene el encabezado, así que las filas iguales de bloques
+    distintos son filas distintas de la hoja y se conservan todas
+    
+    Args:
+        chunks (list): Lista de listas de filas, en orden de bloque
+        
+    Returns:
+        list: Filas unidas en orden
+    """
+    return [row for rows in chunks for row in rows]
+
+
+def compact_records(extracted):
+    """
+    Une los registros con la misma fecha, OP, operario, actividad y equipo,
+    sumando los tiempos (redondeados a medias horas)
+    
+    Args:
+        extracted (list): Pares (origen, registros); el origen es normalmente el
+            nombre de la hoja
+        
+    Returns:
+        tuple: (registros compactados en orden de primera aparición,
+                auditoría con los registros de origen de cada registro unido)
+    """
+    groups = {}
+    for source, records in extracted:
+        for position, record in enumerate(records or [], 1):
+            key = (
+                record.get("fecha"), str(record.get("OP")), _plain(str(record.get("operario", ""))),
+                " ".join(_plain(str(record.get("actividad", ""))).split()), str(record.get("equipo")),
+            )
+            groups.setdefault(key, []).append((source, position, record))
+
+    compacted, audit = [], []
+    for members in groups.values():
+        record = dict(members[0][2])
+        if len(members) > 1:
+            for field in ("tiempo_ordinario", "tiempo_extra"):
+                total = sum(parse_hours(str(m[2].get(field) or "0")) or 0.0 for m in members)
+                record[field] = format_hours(round(total * 2) / 2)
+            audit.append({
+                "registro": record,
+                "origen": [
+                    {
+                        "hoja": source,
+                        "posicion": position,
+                        "tiempo_ordinario": original.get("tiempo_ordinario"),
+                        "tiempo_extra": original.get("tiempo_extra"),
+                    }
+                    for source, position, original in members
+                ],
+            })
+        compacted.append(record)
+    return compacted, audit
+
+
+def save_compaction_audit(audit, json_file):
+    """
+    Guarda la auditoría de la compactación junto al JSON de registros
+    
+    Returns:
+        str: Ruta del archivo de auditoría
+    """
+    audit_path = f"{os.path.splitext(json_file)[0]}_compactacion.json"
+    tmp_path = f"{audit_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(audit, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, audit_path)
+    return audit_path
+
+
+def compact_json_file(json_file):
+    """
+    Compacta un JSON de registros ya generado
+    
+    El resultado se guarda en el subdirectorio compactados/ para que el modo
+    vigilancia del registro (que lee los JSON del directorio) no envíe los
+    registros originales y también los compactados
+    
+    Returns:
+        tuple: (ruta del JSON compactado, ruta de la auditoría)
+    """
+    with open(json_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    compacted, audit = compact_records([(os.path.basename(json_file), records)])
+    output_dir = os.path.join(os.path.dirname(json_file), COMPACTED_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, os.path.basename(json_file))
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(compacted, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, output_file)
+    audit_file = save_compaction_audit(audit, output_file)
+    print(f"🗜️ {len(records)} registros → {len(compacted)} ({len(audit)} unidos)")
+    return output_file, audit_file
+
+
+def _label_value(cells, label):
+    """Valor que acompaña a una etiqueta ("FECHA:") en la misma celda o en la siguiente no vacía"""
+    for i, cell in enumerate(cells):
+        plain = _plain(cell)
+        if plain.startswith(label):
+            inline = cell.split(":", 1)[1].strip() if ":" in cell else ""
+            if inline:
+                return inline
+            return next((c for c in cells[i + 1:] if c), "")
+    return None
+
+
+def parse_sheet_locally(sheet_text, equipo_value):
+    """
+    Extractor basado en reglas para hojas con el formato estándar
+    (FECHA, NOMBRE y tabla OP / DESCRIPCION / TIEMPO / EXTRAS)
+    
+    Args:
+        sheet_text (str): Texto de la hoja separado por tabulaciones
+        equipo_value (str): Valor del equipo
+        
+    Returns:
+        dict: {"confiable": bool, "motivo": str, "registros": list}
+    """
+    def verdict(confiable, motivo, registros=None):
+        return {"confiable": confiable, "motivo": motivo, "registros": registros or []}
+    
+    fecha = operario = None
+    columns = None
+    rows = []
+    
+    for line in sheet_text.splitlines():
+        cells = [cell.strip() for cell in line.split("\t")]
+        plain_cells = [_plain(cell) for cell in cells]
+        
+        if columns is None:
+            nombre = _label_value(cells, "NOMBRE")
+            if nombre is not None and operario is None:
+                operario = nombre
+            valor_fecha = _label_value(cells, "FECHA")
+            if valor_fecha is not None and fecha is None:
+                fecha = valor_fecha
+            
+            if _is_table_header(plain_cells):
+                columns = {
+                    "op": plain_cells.index("OP"),
+                    "descripcion": plain_cells.index("DESCRIPCION"),
+                    "tiempo": plain_cells.index("TIEMPO"),
+                    "extra": next((i for i, c in enumerate(plain_cells) if c.startswith("EXTRA")), None),
+                }
+            continue
+        
+        if any(c.startswith("OBSERVACIONES") or c.startswith("FECHA DE EMISION") for c in plain_cells):
+            break
+        if any(cells):
+            rows.append(cells)
+    
+    if columns is None:
+        return verdict(False, "No se encontró la tabla OP / DESCRIPCION / TIEMPO")
+    if not rows:
+        return verdict(True, "Hoja sin registros")
+    if not operario:
+        return verdict(False, "No se encontró NOMBRE")
+    
+    fecha_convertida = parse_sheet_date(fecha or "")
+    if not fecha_convertida:
+        return verdict(False, f"Fecha no reconocida: '{fecha}'")
+    
+    def cell(row, key):
+        index = columns[key]
+        return row[index] if index is not None and index < len(row) else ""
+    
+    operario = " ".join(operario.split()).title()
+    filas = []
+    for row in rows:
+        ops = split_ops(cell(row, "op"))
+        actividad = cell(row, "descripcion")
+        tiempo = parse_hours(cell(row, "tiempo"))
+        extra_text = cell(row, "extra")
+        extra = parse_hours(extra_text) if extra_text else 0.0
+        
+        if ops is None or not actividad or tiempo is None or extra is None:
+            return verdict(False, f"Fila no reconocida: {' | '.join(c for c in row if c)}")
+        
+        filas.append({
+            "fecha": fecha_convertida,
+            "OP": ops,
+            "operario": operario,
+            "actividad": actividad,
+            "tiempo_ordinario": tiempo,
+            "tiempo_extra": extra,
+            "equipo": str(equipo_value)
+        })
+    
+    return verdict(True, "Formato estándar", expand_time_groups(filas))
+
+
+def file_sha256(file_path):
+    """
+    Hash SHA-256 del contenido de un archivo
+    
+    Args:
+        file_path (str): Ruta del archivo
+        
+    Returns:
+        str: Hash hexadecimal
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_workbooks(source):
+    """
+    Busca libros de Excel en un directorio o con un patrón glob
+    
+    Args:
+        source (str): Directorio o patrón (ej: "entrada/HOJA DE PRODUCCION*.xlsx")
+        
+    Returns:
+        list: Rutas ordenadas (sin archivos temporales "~$" de Excel)
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path)
+        and path.lower().endswith(WORKBOOK_EXTENSIONS)
+        and not os.path.basename(path).startswith("~$")
+    )
+
+
+def read_workbook_sheets(file_path):
+    """
+    Lee todas las hojas de un libro (función de nivel de módulo para ProcessPoolExecutor)
+    
+    Args:
+        file_path (str): Ruta del archivo Excel
+        
+    Returns:
+        list: Tuplas (nombre_hoja, texto_hoja, segundos_de_lectura)
+    """
+    sheets = []
+    start = time.perf_counter()
+    for sheet_name, sheet_text in ExcelProductionProcessor.iter_excel_sheets(file_path):
+        sheets.append((sheet_name, sheet_text, time.perf_counter() - start))
+        start = time.perf_counter()
+    return sheets
+
+
+def load_workbook_sheets(file_path, cache_dir=None):
+    """
+    Lee las hojas de un libro usando la caché de libros si está disponible
+    (función de nivel de módulo para ProcessPoolExecutor)
+    
+    Args:
+        file_path (str): Ruta del archivo Excel
+        cache_dir (str): Directorio de la caché de libros (None = sin caché)
+        
+    Returns:
+        tuple: (tuplas (nombre_hoja, texto_hoja, segundos_de_lectura), cambios por hoja)
+    """
+    cache = WorkbookCache(cache_dir) if cache_dir else None
+    start = time.perf_counter()
+    cached = cache.get(file_path) if cache else None
+    if cached is not None:
+        elapsed = time.perf_counter() - start
+        sheets = [(name, text, elapsed if i == 0 else 0.0) for i, (name, text) in enumerate(cached)]
+        return sheets, WorkbookCache.unchanged(cached)
+    
+    sheets = read_workbook_sheets(file_path)
+    changes = cache.set(file_path, [(name, text) for name, text, _ in sheets]) if cache else None
+    return sheets, changes
+
+
+class WorkbookCache:
+    def __init__(self, cache_dir=WORKBOOK_CACHE_DIR, max_entries=500):
+        """
+        Caché en disco del texto normalizado de cada hoja de un libro (JSON con gzip),
+        válida mientras el archivo conserve tamaño y mtime, o el mismo hash
+        
+        Args:
+            cache_dir (str): Directorio de la caché
+            max_entries (int): Máximo de libros almacenados
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, file_path):
+        key = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def _read(self, file_path):
+        try:
+            with gzip.open(self._path(file_path), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, EOFError, json.JSONDecodeError):
+            return None
+
+    def _write(self, file_path, entry):
+        path = self._path(file_path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _sheet_hash(sheet_text):
+        return hashlib.sha256(sheet_text.encode("utf-8")).hexdigest()
+
+    def get(self, file_path):
+        """
+        Hojas de un libro sin volver a decodificar el Excel
+        
+        Args:
+            file_path (str): Ruta del archivo Excel
+            
+        Returns:
+            list: Pares (nombre_hoja, texto_hoja) o None si el libro cambió o no está
+        """
+        entry = self._read(file_path)
+        if entry is None:
+            return None
+        stat = os.stat(file_path)
+        if entry["size"] != stat.st_size:
+            return None
+        if entry["mtime"] != stat.st_mtime:
+            # Misma longitud pero otra fecha: comprobar el contenido
+            if entry["sha256"] != file_sha256(file_path):
+                return None
+            entry["mtime"] = stat.st_mtime
+            self._write(file_path, entry)
+        os.utime(self._path(file_path))
+        return [(sheet["nombre"], sheet["texto"]) for sheet in entry["hojas"]]
+
+    def set(self, file_path, sheets, sha256=None):
+        """
+        Guarda las hojas de un libro y compara con la versión anterior
+        
+        Args:
+            file_path (str): Ruta del archivo Excel
+            sheets (list): Pares (nombre_hoja, texto_hoja)
+            sha256 (str): Hash del archivo si ya se calculó
+            
+        Returns:
+            dict: Hojas nuevas, modificadas, sin cambios y eliminadas
+        """
+        previous = self._read(file_path)
+        old_hashes = {sheet["nombre"]: sheet["hash"] for sheet in previous["hojas"]} if previous else {}
+        stat = os.stat(file_path)
+        entry = {
+            "ruta": os.path.abspath(file_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256 or file_sha256(file_path),
+            "hojas": [{"nombre": name, "hash": self._sheet_hash(text), "texto": text} for name, text in sheets],
+        }
+        self._write(file_path, entry)
+        self.evict()
+
+        changes = {"nuevas": [], "modificadas": [], "sin_cambios": [], "eliminadas": []}
+        for sheet in entry["hojas"]:
+            old_hash = old_hashes.pop(sheet["nombre"], None)
+            if old_hash is None:
+                changes["nuevas"].append(sheet["nombre"])
+            elif old_hash != sheet["hash"]:
+                changes["modificadas"].append(sheet["nombre"])
+            else:
+                changes["sin_cambios"].append(sheet["nombre"])
+        changes["eliminadas"] = sorted(old_hashes) if previous else []
+        return changes
+
+    @staticmethod
+    def unchanged(sheets):
+        """Reporte de cambios de un libro leído de la caché"""
+        return {"nuevas": [], "modificadas": [], "sin_cambios": [name for name, _ in sheets], "eliminadas": []}
+
+    def evict(self):
+        """Elimina los libros menos usados si se excede max_entries"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json.gz"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def describe_sheet_changes(changes):
+    """Resumen de una línea del reporte de cambios por hoja"""
+    if changes is None:
+        return ""
+    parts = []
+    for key, label in (("modificadas", "modificadas"), ("nuevas", "nuevas"), ("eliminadas", "eliminadas")):
+        if changes[key]:
+            parts.append(f"{len(changes[key])} {label} ({', '.join(changes[key])})")
+    parts.append(f"{len(changes['sin_cambios'])} sin cambios")
+    return ", ".join(parts)
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=5000, max_bytes=50 * 1024 * 1024,
+                 max_age_days=90):
+        """
+        Caché en disco de registros extraídos, direccionada por contenido
+        
+        Args:
+            cache_dir (str): Directorio de la caché
+            max_entries (int): Máximo de hojas almacenadas
+            max_bytes (int): Tamaño máximo total en bytes
+            max_age_days (int): Antigüedad máxima de una entrada en días
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, sheet_text, model, equipo_value):
+        """
+        Calcula la clave de una hoja
+        
+        Args:
+            sheet_text (str): Texto de la hoja
+            model (str): Modelo de OpenAI
+            equipo_value (str): Valor del equipo
+            
+        Returns:
+            str: Hash SHA-256 hexadecimal
+        """
+        payload = json.dumps(
+            [PROMPT_VERSION, model, str(equipo_value), normalize_sheet_text(sheet_text)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Obtiene los registros de una clave
+        
+        Args:
+            key (str): Clave de la hoja
+            
+        Returns:
+            list: Registros almacenados o None si no hay entrada válida
+        """
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            # Marcar como usada recientemente (la expulsión es por mtime)
+            os.utime(path)
+            return records
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def set(self, key, records):
+        """
+        Guarda los registros validados de una clave
+        
+        Args:
+            key (str): Clave de la hoja
+            records (list): Registros validados
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Elimina entradas vencidas y las menos usadas si se exceden los límites"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            # get() elimina entradas vencidas sin el lock: cualquier archivo puede desaparecer
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                    if now - stat.st_mtime > self.max_age:
+                        os.remove(entry.path)
+                    else:
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+            
+            entries.sort()
+            total_bytes = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+
+    def clear(self):
+        """Vacía la caché"""
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+
+class ExtractionMetrics:
+    FIELDS = ("tiempo_lectura", "solicitudes", "tokens_prompt", "tokens_respuesta",
+              "latencia_api", "reintentos", "fallos_parseo", "bloques", "registros",
+              "tokens_hoja", "tokens_hoja_compacta")
+
+    def __init__(self):
+        """Métricas por hoja de una ejecución del extractor (thread-safe)"""
+        self._sheets = {}
+        self._lock = threading.Lock()
+        self.tiempo_guardado = 0.0
+        self.started = datetime.now()
+
+    def sheet(self, sheet_name, workbook=None):
+        """
+        Obtiene (o crea) la entrada de métricas de una hoja
+        
+        Args:
+            sheet_name (str): Nombre de la hoja
+            workbook (str): Libro al que pertenece
+            
+        Returns:
+            dict: Entrada de métricas
+        """
+        key = (workbook, sheet_name)
+        with self._lock:
+            if key not in self._sheets:
+                entry = {"libro": workbook, "hoja": sheet_name, "fuente": None}
+                entry.update({field: 0 for field in self.FIELDS})
+                self._sheets[key] = entry
+            return self._sheets[key]
+
+    def add(self, entry, **values):
+        """Suma valores a los contadores de una entrada"""
+        if entry is None:
+            return
+        with self._lock:
+            for field, value in values.items():
+                entry[field] += value
+
+    def set(self, entry, **values):
+        """Asigna valores a una entrada"""
+        if entry is None:
+            return
+        with self._lock:
+            entry.update(values)
+
+    def entries(self, workbook=None):
+        """Entradas de todas las hojas o solo de un libro"""
+        with self._lock:
+            return [dict(entry) for (book, _), entry in self._sheets.items()
+                    if workbook is None or book == workbook]
+
+    def summary(self, workbook=None):
+        """
+        Resumen agregado de las hojas
+        
+        Args:
+            workbook (str): Limitar al libro indicado (None = todos)
+            
+        Returns:
+            dict: Totales, latencias y hojas más costosas
+        """
+        entries = self.entries(workbook)
+        totals = {field: sum(entry[field] for entry in entries) for field in self.FIELDS}
+        with_api = [entry for entry in entries if entry["solicitudes"]]
+        
+        fuentes = {}
+        for entry in entries:
+            fuentes[entry["fuente"]] = fuentes.get(entry["fuente"], 0) + 1
+        
+        summary = {
+            "hojas": len(entries),
+            "por_fuente": fuentes,
+            **{field: round(value, 4) if isinstance(value, float) else value for field, value in totals.items()},
+            "latencia_api_media": round(totals["latencia_api"] / totals["solicitudes"], 4) if totals["solicitudes"] else 0,
+            "latencia_api_max_hoja": round(max((entry["latencia_api"] for entry in with_api), default=0), 4),
+            "tiempo_guardado": round(self.tiempo_guardado, 4),
+        }
+        if with_api:
+            slowest = max(with_api, key=lambda entry: entry["latencia_api"])
+            costliest = max(with_api, key=lambda entry: entry["tokens_prompt"] + entry["tokens_respuesta"])
+            summary["hoja_mas_lenta"] = slowest["hoja"]
+            summary["hoja_mas_costosa"] = costliest["hoja"]
+        return summary
+
+    def write(self, output_dir="output"):
+        """
+        Escribe el archivo de métricas de la ejecución
+        
+        Args:
+            output_dir (str): Directorio de salida (se usa el subdirectorio metricas/)
+            
+        Returns:
+            str: Ruta del archivo
+        """
+        metrics_dir = os.path.join(output_dir, METRICS_DIR)
+        os.makedirs(metrics_dir, exist_ok=True)
+        file_path = os.path.join(metrics_dir, f"metricas_{self.started.strftime('%Y%m%d_%H%M%S')}.json")
+        
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({"inicio": self.started.isoformat(timespec="seconds"),
+                       "resumen": self.summary(),
+                       "hojas": self.entries()}, f, indent=2, ensure_ascii=False)
+        return file_path
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=60.0):
+        """
+        Limitador de solicitudes y tokens por minuto (ventana deslizante, thread-safe)
+        
+        Args:
+            requests_per_minute (int): Máximo de solicitudes por ventana (None = sin límite)
+            tokens_per_minute (int): Máximo de tokens por ventana (None = sin límite)
+            window (float): Tamaño de la ventana en segundos
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """
+        Bloquea hasta que la solicitud cabe dentro de los límites
+        
+        Args:
+            tokens (int): Tokens estimados de la solicitud
+            
+        Returns:
+            float: Segundos esperados
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.window:
+                    _, old_tokens = self._events.popleft()
+                    self._tokens_in_window -= old_tokens
+                
+                requests_ok = (not self.requests_per_minute
+                               or len(self._events) < self.requests_per_minute)
+                # Una solicitud más grande que el límite pasa sola con la ventana vacía
+                tokens_ok = (not self.tokens_per_minute
+                             or not self._events
+                             or self._tokens_in_window + tokens <= self.tokens_per_minute)
+                
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return waited
+                
+                delay = self.window - (now - self._events[0][0])
+            
+            time.sleep(delay)
+            waited += delay
+
 
 class ExcelProductionProcessor:
-    def __init__(self, api_key, equipo_value="30"):
+    def __init__(self, api_key, equipo_value="30", max_workers=4,
+                 requests_per_minute=None, tokens_per_minute=None, model=DEFAULT_MODEL,
+                 use_cache=True, refresh_cache=False, cache_dir=CACHE_DIR,
+                 use_local_parser=True, streaming=False, max_retries=3, compact=False):
+        """
+        Procesador mejorado para hojas de producción Excel
+        
+        Args:
+            api_key (str): API Key de OpenAI
+            equipo_value (str): Valor del equipo por defecto
+            max_workers (int): Hojas procesadas en paralelo (1 = secuencial)
+            requests_per_minute (int): Límite de solicitudes por minuto a OpenAI
+            tokens_per_minute (int): Límite de tokens por minuto a OpenAI
+            model (str): Modelo de OpenAI a utilizar
+            use_cache (bool): Usar la caché de extracción en disco
+            refresh_cache (bool): Ignorar entradas existentes y volver a consultar OpenAI
+            cache_dir (str): Directorio de la caché (la de libros va en su subdirectorio libros/)
+            use_local_parser (bool): Intentar el extractor local antes de OpenAI
+            streaming (bool): Recibir las respuestas en streaming y conservar los
+                registros completos aunque el final de la respuesta llegue dañado
+            max_retries (int): Reintentos ante errores transitorios de la API
+            compact (bool): Unir los registros repetidos (misma fecha, OP, operario,
+                actividad y equipo) antes de guardar
+        """
+        # Los reintentos se hacen aquí para poder contarlos en las métricas
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.equipo_value = equipo_value
+        self.max_workers = max(1, int(max_workers))
+        self.model = model
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = ExtractionCache(cache_dir) if use_cache else None
+        self.workbook_cache = WorkbookCache(os.path.join(cache_dir, WORKBOOK_CACHE_SUBDIR)) if use_cache else None
+        self.refresh_cache = refresh_cache
+        self.use_local_parser = use_local_parser
+        self.streaming = streaming
+        self.max_retries = max_retries
+        self.compact = compact
+        self.metrics = ExtractionMetrics()
+        self._executor = None
+        self._chunk_executor = None
+        self._executor_lock = threading.Lock()
+        # Cola acotada compartida por todos los libros: bloquea al productor si se llena
+        self._pending = threading.BoundedSemaphore(self.max_workers * 2)
+        
+    def read_excel_sheets(self, file_path):
+        """
+        Lee todas las hojas de un archivo Excel
+        
+        Args:
+            file_path (str): Ruta del archivo Excel
+            
+        Returns:
+            dict: Diccionario con los datos de todas las hojas
+        """
+        try:
+            return dict(self.iter_excel_sheets(file_path))
+        except Exception as e:
+            print(f"❌ Error al leer Excel: {e}")
+            return {}
+    
+    @staticmethod
+    def iter_excel_sheets(file_path):
+        """
+        Lee las hojas de un archivo Excel de una en una (generador)
+        
+        Los .xlsx se recorren en modo de solo lectura de openpyxl, de modo que la
+        primera hoja está disponible antes de leer las siguientes y la memoria
+        se mantiene en el tamaño de una hoja. Otros formatos (.xls) se leen con
+        pandas hoja por hoja.
+        
+        Args:
+            file_path (str): Ruta del archivo Excel
+            
+        Yields:
+            tuple: (nombre_hoja, texto_hoja) con celdas separadas por tabulaciones
+        """
+        if os.path.splitext(file_path)[1].lower() in (".xlsx", ".xlsm"):
+            sheets = ExcelProductionProcessor._iter_sheets_openpyxl(file_path)
+        else:
+            sheets = ExcelProductionProcessor._iter_sheets_pandas(file_path)
+        
+        for sheet_name, sheet_text in sheets:
+            # Solo hojas con contenido
+            if sheet_text:
+                yield sheet_name, sheet_text
+    
+    @staticmethod
+    def _iter_sheets_openpyxl(file_path):
+        """Recorre las filas de cada hoja en modo de solo lectura"""
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                # La etiqueta <dimension> puede estar mal en libros generados por otras
+                # herramientas; sin ella se leen todas las filas y columnas (como pandas)
+                worksheet.reset_dimensions()
+                rows = []
+                for row in worksheet.iter_rows(values_only=True):
+                    row_data = ["" if cell is None else str(cell).strip() for cell in row]
+                    while row_data and not row_data[-1]:
+                        row_data.pop()
+                    # Solo agregar filas que no estén completamente vacías
+                    if row_data:
+                        rows.append(row_data)
+                
+                # Mismo ancho para todas las filas (hasta la última columna con datos)
+                width = max((len(row_data) for row_data in rows), default=0)
+                yield worksheet.title, "\n".join(
+                    "\t".join(row_data + [""] * (width - len(row_data))) for row_data in rows
+                )
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _iter_sheets_pandas(file_path):
+        """Convierte cada hoja con operaciones vectorizadas sobre el DataFrame completo"""
+        with pd.ExcelFile(file_path) as excel_file:
+            for sheet_name in excel_file.sheet_names:
+                df = excel_file.parse(sheet_name, header=None)
+                if df.empty:
+                    yield sheet_name, ""
+                    continue
+                
+                cells = df.astype(object).where(df.notna(), "").astype(str)
+                cells = cells.apply(lambda column: column.str.strip())
+                cells = cells[cells.ne("").any(axis=1)]
+                if cells.empty:
+                    yield sheet_name, ""
+                    continue
+                
+                lines = cells.iloc[:, 0].str.cat(cells.iloc[:, 1:], sep="\t") if cells.shape[1] > 1 else cells.iloc[:, 0]
+                yield sheet_name, "\n".join(lines)
+    
+    def build_prompt(self, sheet_text):
+        """
+        Mensaje variable del prompt: el equipo y la hoja (las reglas están en SYSTEM_PROMPT)
+        
+        Args:
+            sheet_text (str): Contenido de la hoja (ya compacto)
+            
+        Returns:
+            str: Mensaje de usuario
+        """
+        return f"EQUIPO: {self.equipo_value}\nHOJA:\n{sheet_text}"
+    
+    def build_request_body(self, sheet_text):
+        """
+        Cuerpo de la solicitud chat.completions para una hoja o bloque
+        
+        Args:
+            sheet_text (str): Contenido de la hoja
+            
+        Returns:
+            dict: Parámetros de chat.completions.create
+        """
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": self.build_prompt(sheet_text)}
+            ],
+            "temperature": 0.1,
+            "max_tokens": MAX_COMPLETION_TOKENS
+        }
+    
+    def prompt_sections(self, sheet_text, stats=None):
+        """
+        Codifica la hoja de forma compacta y la separa en contexto y filas
+        
+        Args:
+            sheet_text (str): Contenido de la hoja
+            stats (dict): Entrada de métricas donde anotar los tokens antes y después
+            
+        Returns:
+            tuple: (lineas_contexto, lineas_datos)
+        """
+        compact = encode_sheet_compact(sheet_text)
+        self.metrics.add(stats, tokens_hoja=estimate_tokens(sheet_text),
+                         tokens_hoja_compacta=estimate_tokens(compact))
+        return split_sheet_sections(compact)
+    
+    def token_report(self, file_paths, output_dir="output"):
+        """
+        Compara, sin consultar la API, los tokens de entrada por hoja entre el
+        prompt de la versión 2 (PROMPT_V2_TEMPLATE: instrucciones y hoja sin
+        compactar en un solo mensaje) y el actual (prefijo fijo + hoja compacta)
+        
+        Args:
+            file_paths (list): Libros a analizar
+            output_dir (str): Directorio de salida (se usa metricas/)
+            
+        Returns:
+            str: Ruta del reporte
+        """
+        prefix_tokens = estimate_tokens(SYSTEM_PROMPT)
+        rows = []
+        if prefix_tokens >= PROMPT_CACHE_MIN_TOKENS:
+            print(f"🔢 Prefijo fijo: ~{prefix_tokens} tokens (cacheable por OpenAI)")
+        else:
+            print(f"🔢 Prefijo fijo: ~{prefix_tokens} tokens (por debajo del mínimo de "
+                  f"{PROMPT_CACHE_MIN_TOKENS} para la caché de prompts de OpenAI)")
+        print(f"{'Hoja':<30} {'Antes':>8} {'Después':>8} {'Variable':>9} {'Ahorro':>7}")
+        for file_path in file_paths:
+            for sheet_name, sheet_text in self.iter_excel_sheets(file_path):
+                before = estimate_tokens(PROMPT_V2_TEMPLATE.format(sheet_text=sheet_text, equipo=self.equipo_value))
+                variable = estimate_tokens(self.build_prompt(encode_sheet_compact(sheet_text)))
+                after = prefix_tokens + variable
+                rows.append({"libro": file_path, "hoja": sheet_name, "tokens_antes": before,
+                             "tokens_despues": after, "tokens_variables": variable})
+                label = f"{os.path.basename(file_path)[:18]}/{sheet_name}"[:30]
+                print(f"{label:<30} {before:>8} {after:>8} {variable:>9} {1 - after / before:>7.0%}")
+        
+        total_before = sum(row["tokens_antes"] for row in rows)
+        total_after = sum(row["tokens_despues"] for row in rows)
+        if total_before:
+            print(f"{'TOTAL':<30} {total_before:>8} {total_after:>8} "
+                  f"{sum(row['tokens_variables'] for row in rows):>9} {1 - total_after / total_before:>7.0%}")
+        
+        metrics_dir = os.path.join(output_dir, METRICS_DIR)
+        os.makedirs(metrics_dir, exist_ok=True)
+        report_path = os.path.join(metrics_dir, f"tokens_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({"prompt_version": PROMPT_VERSION, "tokens_prefijo": prefix_tokens,
+                       "prefijo_cacheable": prefix_tokens >= PROMPT_CACHE_MIN_TOKENS, "hojas": rows},
+                      f, indent=2, ensure_ascii=False)
+        return report_path
+    
+    def process_sheet_with_openai(self, sheet_text, sheet_name):
+        """
+        Procesa una hoja con OpenAI usando prompt mejorado
+        
+        Args:
+            sheet_text (str): Contenido de la hoja
+            sheet_name (str): Nombre de la hoja
+            
+        Returns:
+            list: Datos extraídos y procesados
+        """
+        stats = self.metrics.sheet(sheet_name)
+        self.metrics.set(stats, fuente="openai")
+        records, _ = self._extract_with_openai(sheet_text, sheet_name, stats)
+        return records
+    
+    def _extract_with_openai(self, sheet_text, sheet_name, stats=None):
+        """
+        Extrae una hoja con OpenAI dividiéndola en bloques si la respuesta
+        estimada no cabe en max_tokens
+        
+        Args:
+            sheet_text (str): Contenido de la hoja
+            sheet_name (str): Nombre de la hoja
+            stats (dict): Entrada de métricas de la hoja
+            
+        Returns:
+            tuple: (registros validados, True si todos los bloques se extrajeron completos)
+        """
+        context, rows = self.prompt_sections(sheet_text, stats)
+        
+        if len(rows) <= ROWS_PER_CHUNK:
+            data, complete = self._extract_chunk(context, rows, sheet_name, stats)
+            return self.validate_and_fix_times(data), complete
+        
+        blocks = [rows[i:i + ROWS_PER_CHUNK] for i in range(0, len(rows), ROWS_PER_CHUNK)]
+        print(f"✂️ {sheet_name}: {len(rows)} filas divididas en {len(blocks)} bloques")
+        
+        with self._executor_lock:
+            if self._chunk_executor is None:
+                self._chunk_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        
+        futures = [
+            self._chunk_executor.submit(self._extract_chunk, context, block,
+                                        f"{sheet_name} [{i}/{len(blocks)}]", stats)
+            for i, block in enumerate(blocks, 1)
+        ]
+        parts = [future.result() for future in futures]
+        
+        data = merge_chunk_rows([part_data for part_data, _ in parts])
+        complete = all(part_complete for _, part_complete in parts)
+        return self.validate_and_fix_times(data), complete
+    
+    def _extract_chunk(self, context, rows, label, stats=None):
         """
-        Procesador mejorado para hojas de producción Excel
+        Envía un bloque (contexto + filas) a OpenAI
+        
+        Si la respuesta se corta por max_tokens, el bloque se divide en dos y se
+        vuelve a solicitar, de modo que no se pierdan filas por truncamiento.
         
         Args:
-            api_key (str): API Key de OpenAI
-            equipo_value (str): Valor del equipo por defecto
+            context (list): Líneas de encabezado (FECHA, NOMBRE, títulos)
+            rows (list): Líneas de datos del bloque
+            label (str): Nombre de la hoja/bloque para los mensajes
+            stats (dict): Entrada de métricas de la hoja
+            
+        Returns:
+            tuple: (filas sin validar, True si el bloque se extrajo completo)
         """
-        self.client = OpenAI(api_key=api_key)
-        self.equipo_value = equipo_value
+        body = self.build_request_body("\n".join(context + rows))
+        self.metrics.add(stats, bloques=1)
         
-    def read_excel_sheets(self, file_path):
+        if self.streaming:
+            state = {}
+            data = list(self._iter_stream_rows(body, label, state, stats))
+            finish_reason, parsed = state["finish_reason"], state["complete"]
+        else:
+            try:
+                start = time.perf_counter()
+                response = self._create_completion(body, stats)
+                self.metrics.add(stats, latencia_api=time.perf_counter() - start)
+            except Exception as e:
+                print(f"❌ Error con OpenAI en hoja '{label}': {e}")
+                return [], False
+            
+            self._record_usage(stats, response.usage)
+            choice = response.choices[0]
+            finish_reason = choice.finish_reason
+        
+        if finish_reason == "length" and len(rows) > 1:
+            half = len(rows) // 2
+            print(f"✂️ {label}: respuesta truncada, dividiendo {len(rows)} filas en 2 bloques")
+            first, first_complete = self._extract_chunk(context, rows[:half], f"{label}a", stats)
+            second, second_complete = self._extract_chunk(context, rows[half:], f"{label}b", stats)
+            return merge_chunk_rows([first, second]), first_complete and second_complete
+        
+        if not self.streaming:
+            data, parsed = self.parse_response_rows(choice.message.content or "", label, stats)
+        return data, parsed and finish_reason != "length"
+    
+    def _create_completion(self, body, stats=None, **kwargs):
         """
-        Lee todas las hojas de un archivo Excel
+        Llama a chat.completions.create respetando el limitador y reintentando
+        errores transitorios con espera exponencial
         
         Args:
-            file_path (str): Ruta del archivo Excel
+            body (dict): Cuerpo de la solicitud
+            stats (dict): Entrada de métricas de la hoja
+            **kwargs: Parámetros adicionales (stream, stream_options)
             
         Returns:
-            dict: Diccionario con los datos de todas las hojas
+            Respuesta (o stream) de la API
         """
-        try:
-            # Leer todas las hojas
-            excel_data = pd.read_excel(file_path, sheet_name=None, header=None)
-            
-            sheets_text = {}
-            for sheet_name, df in excel_data.items():
-                # Convertir DataFrame a texto preservando estructura
-                sheet_content = []
-                
-                for index, row in df.iterrows():
-                    row_data = []
-                    for cell in row:
-                        if pd.notna(cell):
-                            row_data.append(str(cell).strip())
-                        else:
-                            row_data.append("")
-                    
-                    # Solo agregar filas que no estén completamente vacías
-                    if any(cell for cell in row_data):
-                        sheet_content.append("\t".join(row_data))
-                
-                if sheet_content:
-                    sheets_text[sheet_name] = "\n".join(sheet_content)
-            
-            return sheets_text
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in body["messages"])
+        attempt = 0
+        while True:
+            # Respetar límites de solicitudes/tokens por minuto
+            self.rate_limiter.acquire(prompt_tokens + body["max_tokens"])
+            self.metrics.add(stats, solicitudes=1)
+            try:
+                #model="o4-mini-2025-04-16",  # Modelo más reciente y eficiente
+                return self.client.chat.completions.create(**body, **kwargs)
+            except RETRYABLE_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.metrics.add(stats, reintentos=1)
+                time.sleep(min(30, 2 ** attempt))
+    
+    def _record_usage(self, stats, usage):
+        """Acumula los tokens informados por la API"""
+        if usage is not None:
+            self.metrics.add(stats, tokens_prompt=usage.prompt_tokens or 0,
+                             tokens_respuesta=usage.completion_tokens or 0)
+    
+    def _iter_stream_rows(self, body, label, state, stats=None):
+        """
+        Solicita una respuesta en streaming y genera cada fila en cuanto se completa
+        
+        Args:
+            body (dict): Cuerpo de la solicitud
+            label (str): Nombre de la hoja/bloque para los mensajes
+            state (dict): Se completa con finish_reason y complete al terminar
+            stats (dict): Entrada de métricas de la hoja
             
+        Yields:
+            dict: Filas sin validar
+        """
+        parser = JsonArrayStreamParser()
+        state["finish_reason"] = None
+        state["complete"] = False
+        start = time.perf_counter()
+        try:
+            stream = self._create_completion(body, stats, stream=True,
+                                             stream_options={"include_usage": True})
+            for chunk in stream:
+                self._record_usage(stats, getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                for row in parser.feed(choice.delta.content or ""):
+                    if isinstance(row, dict):
+                        yield row
+                if choice.finish_reason:
+                    state["finish_reason"] = choice.finish_reason
         except Exception as e:
-            print(f"❌ Error al leer Excel: {e}")
-            return {}
+            # Las filas ya entregadas se conservan
+            print(f"❌ Error con OpenAI en hoja '{label}': {e}")
+            return
+        finally:
+            self.metrics.add(stats, latencia_api=time.perf_counter() - start,
+                             fallos_parseo=parser.errors)
+        
+        if parser.errors or parser.pending:
+            print(f"⚠️ {label}: respuesta incompleta ({parser.errors} objetos inválidos), se conservan las filas válidas")
+        state["complete"] = state["finish_reason"] == "stop" and not parser.errors and not parser.pending
     
-    def process_sheet_with_openai(self, sheet_text, sheet_name):
+    def stream_sheet_records(self, sheet_text, sheet_name, workbook=None):
         """
-        Procesa una hoja con OpenAI usando prompt mejorado
+        Extrae una hoja y entrega cada registro validado en cuanto está disponible
+        
+        Usa las mismas fuentes que extract_sheet (extractor local, caché y OpenAI).
+        Con OpenAI la respuesta se recibe en streaming y cada registro se entrega
+        al completarse; los bloques de hojas grandes se solicitan uno tras otro y,
+        si el final de una respuesta llega dañado, los registros ya entregados se
+        conservan (la hoja no se guarda en caché).
         
         Args:
             sheet_text (str): Contenido de la hoja
             sheet_name (str): Nombre de la hoja
+            workbook (str): Libro al que pertenece (para las métricas)
             
-        Returns:
-            list: Datos extraídos y procesados
+        Yields:
+            dict: Registros validados (uno por OP)
         """
+        stats = self.metrics.sheet(sheet_name, workbook)
+        records, key = self._resolve_without_api(sheet_text, sheet_name, stats)
+        if records is not None:
+            self.metrics.add(stats, registros=len(records))
+            yield from records
+            return
         
-        prompt = f"""Analiza esta hoja de producción Excel y extrae los datos según las siguientes reglas:
-
-CONTENIDO DE LA HOJA:
-{sheet_text}
-
-REGLAS DE EXTRACCIÓN:
-
-1. FECHA: 
-   - Busca patrones como "FECHA: DIA/MES/AÑO" 
-   - Convierte a formato YY-MM-DD (ej: 2025-04-03 → 25-04-03)
-
-2. OPERARIO:
-   - Busca "NOMBRE:" seguido del nombre:
-   - Extrae solo el nombre (ej: "NELSON RANGEL")
-
-3. OPs y DATOS:
-   - Busca líneas con OP, DESCRIPCION, TIEMPO
-   - Si una OP tiene múltiples números separados por "-" (ej: 7027-7028-7029), crear un registro separado para cada OP
-   - Cada OP debe tener: número, descripción, tiempo
-
-4. DISTRIBUCIÓN DE TIEMPO:
-   - Si hay múltiples OPs que comparten tiempo, distribuir equitativamente
-   - IMPORTANTE: Los tiempos deben ser en incrementos de 0.5 (0.5, 1, 1.5, 2, 2.5, etc.)
-   - Ejemplos:
-     * Tiempo 8.5 con 3 OPs → 2.5, 2.5, 3 
-     * Tiempo 1.5 con 3 OPs → 0.5, 0.5, 0.5 
-IMPORTANTE - DISTRIBUCIÓN DE TIEMPO: Los tiempos deben redistribuirse en incrementos de 0.5 horas únicamente.
-   - Si el tiempo total es 8.5 y hay 3 OPs: distribuir como 2, 2, 4.5 (no 2.83 cada una)
-   - Siempre usar valores como: 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, etc.
-   - Priorizar distribución equilibrada pero ajustada a incrementos de 0.5
-   - La suma de las horas de cada OP debe ser el total de horas dadas ejemplo: Tiempo 8.5, 2 OPs → 4, 4.5 total = 8.5
-   
-   EJEMPLOS DE DISTRIBUCIÓN:
-   - Tiempo 8.5, 3 OPs → 2, 2, 4.5
-   - Tiempo 7, 2 OPs → 3.5, 3.5
-   - Tiempo 9, 4 OPs → 2, 2, 2.5, 2.5
-   - Tiempo 5.5, 3 OPs → 1.5, 2, 2
-
-5. CAMPOS REQUERIDOS:
-   - fecha: formato YY-MM-DD
-   - OP: número de la OP (int → ejemplo: 3 : no debe ser 3.0)
-   - operario: nombre en formato "Nombre completo"
-   - actividad: descripción de la actividad
-   - tiempo_ordinario: tiempo en formato string con incrementos de 0.5
-   - tiempo_extra: "0" si no hay tiempo extra especificado
-   - equipo: "{self.equipo_value}"
-
-EJEMPLO DE PROCESAMIENTO:
-Si encuentras: "7027/7028/7029 REUNION DE SEGUIMIENTO ECOPETROL 1,5"
-Debes crear 3 registros separados, cada uno con tiempo 0.5 (mínimo por OP)
-
-FORMATO DE RESPUESTA (JSON válido):
-[
-  {{
-    "fecha": "25-04-03",
-    "OP": 7027,
-    "operario": "Nelson Rangel",
-    "actividad": "REUNION DE SEGUIMIENTO ECOPETROL",
-    "tiempo_ordinario": "0.5",
-    "tiempo_extra": "0",
-    "equipo": "{self.equipo_value}"
-  }},
-  {{
-    "fecha": "25-04-03", 
-    "OP": 7028,
-    "operario": "Nelson Rangel",
-    "actividad": "REUNION DE SEGUIMIENTO ECOPETROL",
-    "tiempo_ordinario": "0.5",
-    "tiempo_extra": "0",
-    "equipo": "{self.equipo_value}"
-  }}
-]
-
-Responde ÚNICAMENTE con el JSON válido, sin texto adicional."""
-
-        try:
-            response = self.client.chat.completions.create(
-                #model="o4-mini-2025-04-16",  # Modelo más reciente y eficiente
-                model="gpt-4.1-2025-04-14",  # Modelo más reciente y eficiente
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                max_tokens=2000
-            )
-            
-            json_response = response.choices[0].message.content.strip()
+        self.metrics.set(stats, fuente="openai")
+        context, rows = self.prompt_sections(sheet_text, stats)
+        blocks = [rows[i:i + ROWS_PER_CHUNK] for i in range(0, len(rows), ROWS_PER_CHUNK)] or [[]]
+        
+        extracted, state = [], {"complete": True}
+        for i, block in enumerate(blocks, 1):
+            label = sheet_name if len(blocks) == 1 else f"{sheet_name} [{i}/{len(blocks)}]"
+            for row in self._stream_block(context, block, label, stats, state):
+                records = self.validate_and_fix_times([row])
+                self.metrics.add(stats, registros=len(records))
+                extracted.extend(records)
+                yield from records
+        
+        if key is not None and extracted and state["complete"]:
+            self.cache.set(key, extracted)
+    
+    def _stream_block(self, context, rows, label, stats, state):
+        """
+        Solicita un bloque en streaming y entrega sus filas a medida que llegan
+        
+        Si la respuesta se corta por max_tokens, las filas ya entregadas cuentan
+        como las primeras del bloque (un objeto por fila de la tabla) y el resto se
+        vuelve a solicitar; si no llegó ninguna, el bloque se divide en dos. Así no
+        se pierden filas por truncamiento ni se repiten las ya entregadas.
+        
+        Args:
+            context (list): Líneas de encabezado (FECHA, NOMBRE, títulos)
+            rows (list): Líneas de datos del bloque
+            label (str): Nombre de la hoja/bloque para los mensajes
+            stats (dict): Entrada de métricas de la hoja
+            state (dict): complete pasa a False si alguna parte no se extrajo completa
             
-            # Limpiar respuesta
-            if json_response.startswith("```json"):
-                json_response = json_response.replace("```json", "").replace("```", "").strip()
-            if json_response.startswith("```"):
-                json_response = json_response.replace("```", "").strip()
+        Yields:
+            dict: Filas sin validar
+        """
+        body = self.build_request_body("\n".join(context + rows))
+        self.metrics.add(stats, bloques=1)
+        block_state = {}
+        delivered = 0
+        for row in self._iter_stream_rows(body, label, block_state, stats):
+            delivered += 1
+            yield row
+        
+        if block_state["finish_reason"] != "length" or delivered >= len(rows):
+            state["complete"] = state["complete"] and block_state["complete"]
+            return
+        if delivered:
+            parts = [rows[delivered:]]
+        elif len(rows) > 1:
+            half = len(rows) // 2
+            parts = [rows[:half], rows[half:]]
+        else:
+            print(f"❌ {label}: respuesta truncada sin ninguna fila completa")
+            self.metrics.add(stats, fallos_parseo=1)
+            state["complete"] = False
+            return
+        
+        print(f"✂️ {label}: respuesta truncada, se solicitan de nuevo {len(rows) - delivered} filas")
+        for suffix, part in zip("ab" if len(parts) > 1 else "+", parts):
+            yield from self._stream_block(context, part, f"{label}{suffix}", stats, state)
+    
+    def parse_response_rows(self, content, label, stats=None):
+        """
+        Limpia y parsea la respuesta JSON del modelo
+        
+        Args:
+            content (str): Texto de la respuesta
+            label (str): Nombre de la hoja/bloque para los mensajes
+            stats (dict): Entrada de métricas de la hoja
             
-            # Parsear JSON
-            try:
-                data = json.loads(json_response)
-                return self.validate_and_fix_times(data)
-            except json.JSONDecodeError as e:
-                print(f"❌ Error JSON en hoja '{sheet_name}': {e}")
-                print(f"Respuesta: {json_response}")
-                return []
-                
-        except Exception as e:
-            print(f"❌ Error con OpenAI en hoja '{sheet_name}': {e}")
-            return []
+        Returns:
+            tuple: (filas sin validar, True si se pudo parsear)
+        """
+        json_response = clean_json_response(content)
+        
+        # Parsear JSON
+        try:
+            data = json.loads(json_response)
+        except json.JSONDecodeError as e:
+            print(f"❌ Error JSON en hoja '{label}': {e}")
+            print(f"Respuesta: {json_response}")
+            self.metrics.add(stats, fallos_parseo=1)
+            return [], False
+        
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list):
+            print(f"❌ Respuesta inesperada en hoja '{label}': {type(data).__name__}")
+            self.metrics.add(stats, fallos_parseo=1)
+            return [], False
+        return data, True
     
     def validate_and_fix_times(self, data):
         """
-        Valida y corrige los tiempos para que estén en incrementos de 0.5
+        Valida los registros y reparte los tiempos en incrementos de 0.5
+        
+        Las filas con varias OPs se dividen en un registro por OP cuyos tiempos
+        suman el total de la fila.
         
         Args:
-            data (list): Lista de registros
+            data (list): Lista de registros (OP entero o lista de OPs)
             
         Returns:
             list: Registros con tiempos corregidos
         """
+        rows = []
         for record in data:
-            try:
-                tiempo = float(record.get('tiempo_ordinario', 0))
-                # Redondear a incrementos de 0.5, mínimo 0.5
-                tiempo_corregido = max(0.5, round(tiempo * 2) / 2)
-                record['tiempo_ordinario'] = str(tiempo_corregido)
-                
-                # Asegurar que tiempo_extra sea string
-                if 'tiempo_extra' not in record:
-                    record['tiempo_extra'] = "0"
-                
-                # Validar OP como entero
-                if 'OP' in record:
-                    record['OP'] = int(record['OP'])
-                    
-            except (ValueError, TypeError):
-                record['tiempo_ordinario'] = "0.5"
-                record['tiempo_extra'] = "0"
+            if not isinstance(record, dict):
+                continue
+            row = dict(record)
+            
+            tiempo = parse_hours(str(row.get('tiempo_ordinario', '')))
+            row['tiempo_ordinario'] = tiempo if tiempo is not None else 0.5
+            
+            extra = parse_hours(str(row.get('tiempo_extra', '0') or '0'))
+            row['tiempo_extra'] = extra if extra is not None else 0.0
+            
+            rows.append(row)
         
-        return data
+        # Una sola pasada vectorizada sobre todos los grupos
+        return expand_time_groups(rows)
     
     def save_results(self, all_data, operario_name, output_dir="output"):
         """
@@ -223,43 +1731,223 @@ Responde ÚNICAMENTE con el JSON válido, sin texto adicional."""
         os.makedirs(output_dir, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{operario_name.lower().replace(' ', '_')}_{timestamp}.json"
-        file_path = os.path.join(output_dir, filename)
+        base_name = f"{operario_name.lower().replace(' ', '_')}_{timestamp}"
+        file_path = os.path.join(output_dir, f"{base_name}.json")
+        # Evitar sobrescribir otro libro del mismo operario guardado en el mismo segundo
+        suffix = 2
+        while os.path.exists(file_path):
+            file_path = os.path.join(output_dir, f"{base_name}_{suffix}.json")
+            suffix += 1
         
-        with open(file_path, 'w', encoding='utf-8') as f:
+        # Escritura atómica: quien vigile el directorio nunca ve un JSON a medias
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(all_data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
         
         return file_path
     
-    def process_excel_file(self, file_path):
+    def extract_sheet(self, sheet_text, sheet_name, workbook=None):
+        """
+        Extrae los datos de una hoja: extractor local, luego caché y por último OpenAI
+        
+        Args:
+            sheet_text (str): Contenido de la hoja
+            sheet_name (str): Nombre de la hoja
+            workbook (str): Libro al que pertenece (para las métricas)
+            
+        Returns:
+            list: Datos extraídos y procesados
+        """
+        stats = self.metrics.sheet(sheet_name, workbook)
+        try:
+            records = self._extract_sheet(sheet_text, sheet_name, stats)
+        except Exception as e:
+            # Un error en una hoja no descarta las demás hojas del libro
+            print(f"❌ Error al procesar hoja '{sheet_name}': {e}")
+            self.metrics.set(stats, error=str(e))
+            records = []
+        self.metrics.add(stats, registros=len(records))
+        return records
+    
+    def _extract_sheet(self, sheet_text, sheet_name, stats):
+        """Resuelve una hoja por la primera fuente disponible y anota cuál se usó"""
+        records, key = self._resolve_without_api(sheet_text, sheet_name, stats)
+        if records is not None:
+            return records
+        
+        self.metrics.set(stats, fuente="openai")
+        records, complete = self._extract_with_openai(sheet_text, sheet_name, stats)
+        # Los errores y extracciones parciales no se almacenan para reintentarlos en la siguiente ejecución
+        if key is not None and records and complete:
+            self.cache.set(key, records)
+        return records
+    
+    def _resolve_without_api(self, sheet_text, sheet_name, stats):
+        """
+        Intenta resolver una hoja con el extractor local y la caché
+        
+        Returns:
+            tuple: (registros o None si hay que consultar OpenAI, clave de caché o None)
+        """
+        if self.use_local_parser:
+            local = parse_sheet_locally(sheet_text, self.equipo_value)
+            if local["confiable"]:
+                print(f"⚡ {sheet_name}: extraída localmente ({local['motivo']})")
+                self.metrics.set(stats, fuente="local")
+                return local["registros"], None
+            print(f"🔎 {sheet_name}: se enviará a OpenAI ({local['motivo']})")
+        
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(sheet_text, self.model, self.equipo_value)
+            if not self.refresh_cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    print(f"💾 {sheet_name}: recuperada de caché")
+                    self.metrics.set(stats, fuente="cache")
+                    return cached, key
+        return None, key
+    
+    def submit_sheet(self, sheet_text, sheet_name, workbook=None):
+        """
+        Envía una hoja al pool de extracción compartido
+        
+        Bloquea mientras haya 2 × max_workers hojas pendientes, de modo que la
+        lectura de libros no se adelante indefinidamente a la extracción.
+        
+        Args:
+            sheet_text (str): Contenido de la hoja
+            sheet_name (str): Nombre de la hoja
+            workbook (str): Libro al que pertenece (para las métricas)
+            
+        Returns:
+            Future: Resultado de extract_sheet
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        
+        self._pending.acquire()
+        future = self._executor.submit(self.extract_sheet, sheet_text, sheet_name, workbook)
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+    
+    def extract_sheets(self, sheets, workbook=None):
+        """
+        Extrae los datos de varias hojas en paralelo (pool acotado por max_workers)
+        
+        Las hojas se consumen a medida que el iterable las produce; como máximo
+        hay 2 × max_workers hojas leídas esperando extracción.
+        
+        Args:
+            sheets (iterable): Pares (nombre_hoja, texto_hoja)
+            workbook (str): Libro al que pertenecen (para las métricas)
+            
+        Returns:
+            list: Pares (nombre_hoja, registros) en el mismo orden de las hojas
+        """
+        if self.max_workers == 1:
+            return [(name, self.extract_sheet(text, name, workbook)) for name, text in sheets]
+        
+        futures = [(name, self.submit_sheet(text, name, workbook)) for name, text in sheets]
+        # Unir en orden de hoja para que operario y archivo de salida sean deterministas
+        return [(name, future.result()) for name, future in futures]
+    
+    def close(self):
+        """Libera el pool de extracción"""
+        with self._executor_lock:
+            for executor in (self._executor, self._chunk_executor):
+                if executor is not None:
+                    executor.shutdown(wait=True)
+            self._executor = None
+            self._chunk_executor = None
+    
+    def process_excel_file(self, file_path, output_dir="output"):
         """
         Procesa archivo Excel completo
         
         Args:
             file_path (str): Ruta del archivo Excel
+            output_dir (str): Directorio de salida
             
         Returns:
             dict: Resultados del procesamiento
         """
         print(f"🚀 Procesando archivo: {os.path.basename(file_path)}")
         
-        # Leer hojas
-        sheets_data = self.read_excel_sheets(file_path)
+        print(f"⚙️ Leyendo y procesando hojas ({self.max_workers} en paralelo)")
+        
+        # Libro sin cambios: las hojas salen de la caché sin decodificar el Excel
+        changes = {}
+        cached = None
+        if self.workbook_cache is not None:
+            try:
+                cached = self.workbook_cache.get(file_path)
+            except OSError:
+                cached = None
+        
+        # Leer hojas de forma incremental: la extracción empieza con la primera hoja leída
+        try:
+            if cached is not None:
+                print("⚡ Libro sin cambios: hojas leídas de la caché de libros")
+                changes.update(WorkbookCache.unchanged(cached))
+                sheets = self._timed_sheets(iter(cached), file_path)
+            else:
+                sheets = self._timed_sheets(self._caching_sheets(file_path, changes), file_path)
+            extracted = self.extract_sheets(sheets, file_path)
+        except Exception as e:
+            print(f"❌ Error al leer Excel: {e}")
+            extracted = []
+        
+        if changes:
+            print(f"🔍 Hojas: {describe_sheet_changes(changes)}")
+        results = self.build_results(extracted, output_dir, file_path)
+        results["cambios_hojas"] = changes or None
+        results["archivo_metricas"] = self.metrics.write(output_dir)
+        return results
+    
+    def _caching_sheets(self, file_path, changes):
+        """Lee las hojas del Excel y, al terminar, las guarda en la caché de libros"""
+        sheets = []
+        for sheet_name, sheet_text in self.iter_excel_sheets(file_path):
+            sheets.append((sheet_name, sheet_text))
+            yield sheet_name, sheet_text
+        if self.workbook_cache is not None:
+            changes.update(self.workbook_cache.set(file_path, sheets))
+    
+    def _timed_sheets(self, sheets, workbook):
+        """Registra el tiempo de lectura de cada hoja a medida que se genera"""
+        start = time.perf_counter()
+        for sheet_name, sheet_text in sheets:
+            stats = self.metrics.sheet(sheet_name, workbook)
+            self.metrics.add(stats, tiempo_lectura=time.perf_counter() - start)
+            yield sheet_name, sheet_text
+            start = time.perf_counter()
+    
+    def build_results(self, extracted, output_dir="output", workbook=None):
+        """
+        Une los registros de las hojas, guarda el JSON y calcula estadísticas
         
-        if not sheets_data:
-            return {"success": False, "error": "No se pudieron leer las hojas del Excel"}
+        Args:
+            extracted (list): Pares (nombre_hoja, registros) en orden de hoja
+            output_dir (str): Directorio de salida
+            workbook (str): Libro procesado (para el resumen de métricas)
+            
+        Returns:
+            dict: Resultados del procesamiento
+        """
+        if not extracted:
+            return {"success": False, "error": "No se pudieron leer las hojas del Excel",
+                    "metricas": self.metrics.summary(workbook)}
         
-        print(f"📄 Hojas encontradas: {list(sheets_data.keys())}")
+        print(f"📄 Hojas encontradas: {[sheet_name for sheet_name, _ in extracted]}")
         
         all_results = []
         operario_name = "desconocido"
         
-        # Procesar cada hoja
-        for sheet_name, sheet_text in sheets_data.items():
-            print(f"⚙️ Procesando: {sheet_name}")
-            
-            sheet_results = self.process_sheet_with_openai(sheet_text, sheet_name)
-            
+        # Recorrer resultados en orden de hoja
+        for sheet_name, sheet_results in extracted:
             if sheet_results:
                 all_results.extend(sheet_results)
                 
@@ -272,10 +1960,21 @@ Responde ÚNICAMENTE con el JSON válido, sin texto adicional."""
                 print(f"⚠️ {sheet_name}: Sin datos extraídos")
         
         if not all_results:
-            return {"success": False, "error": "No se extrajeron datos de ninguna hoja"}
+            return {"success": False, "error": "No se extrajeron datos de ninguna hoja",
+                    "metricas": self.metrics.summary(workbook)}
+        
+        # Unir registros repetidos antes de guardar
+        audit = []
+        if self.compact:
+            extracted_count = len(all_results)
+            all_results, audit = compact_records(extracted)
+            print(f"🗜️ Compactación: {extracted_count} registros → {len(all_results)} ({len(audit)} unidos)")
         
         # Guardar resultados
-        json_file = self.save_results(all_results, operario_name)
+        start = time.perf_counter()
+        json_file = self.save_results(all_results, operario_name, output_dir)
+        audit_file = save_compaction_audit(audit, json_file) if audit else None
+        self.metrics.tiempo_guardado += time.perf_counter() - start
         
         # Estadísticas
         total_ops = len(all_results)
@@ -290,9 +1989,11 @@ Responde ÚNICAMENTE con el JSON válido, sin texto adicional."""
             "ops_unicas": unique_ops,
             "tiempo_total": total_tiempo,
             "fechas_procesadas": fechas_procesadas,
-            "hojas_procesadas": len(sheets_data),
+            "hojas_procesadas": len(extracted),
             "archivo_json": json_file,
-            "datos": all_results
+            "archivo_compactacion": audit_file,
+            "datos": all_results,
+            "metricas": self.metrics.summary(workbook)
         }
         
         print(f"\n🎉 PROCESAMIENTO COMPLETADO")
@@ -300,12 +2001,313 @@ Responde ÚNICAMENTE con el JSON válido, sin texto adicional."""
         print(f"   📊 Registros: {total_ops} ({unique_ops} OPs únicas)")
         print(f"   ⏱️ Tiempo total: {total_tiempo} horas")
         print(f"   📅 Fechas: {', '.join(fechas_procesadas)}")
+        print(f"   🔢 API: {results['metricas']['solicitudes']} solicitudes, "
+              f"{results['metricas']['tokens_prompt']} tokens de prompt, "
+              f"{results['metricas']['tokens_respuesta']} de respuesta")
         print(f"   💾 Guardado en: {json_file}")
         
         return results
 
+    def export_batch_requests(self, file_paths, requests_path, manifest_path=None):
+        """
+        Genera un archivo JSONL de solicitudes para la API de lotes (Batch API)
+        
+        Cada línea es una solicitud a /v1/chat/completions con un custom_id estable
+        "<hash del libro>-<hoja>-<bloque>". Las hojas que el extractor local
+        resuelve con certeza no se envían y sus registros quedan en el manifiesto.
+        
+        Args:
+            file_paths (list): Libros de Excel a incluir
+            requests_path (str): Archivo JSONL de solicitudes a generar
+            manifest_path (str): Manifiesto para la importación (por defecto junto al JSONL)
+            
+        Returns:
+            str: Ruta del manifiesto generado
+        """
+        if manifest_path is None:
+            manifest_path = os.path.splitext(requests_path)[0] + ".manifest.json"
+        
+        manifest = {
+            "prompt_version": PROMPT_VERSION,
+            "model": self.model,
+            "equipo": self.equipo_value,
+            "libros": []
+        }
+        total_requests = 0
+        
+        os.makedirs(os.path.dirname(os.path.abspath(requests_path)), exist_ok=True)
+        with open(requests_path, 'w', encoding='utf-8') as f:
+            for file_path in file_paths:
+                workbook_id = file_sha256(file_path)[:12]
+                workbook = {"archivo": file_path, "id": workbook_id, "hojas": []}
+                
+                for sheet_index, (sheet_name, sheet_text) in enumerate(self.iter_excel_sheets(file_path)):
+                    sheet = {"nombre": sheet_name, "custom_ids": [], "registros": None}
+                    workbook["hojas"].append(sheet)
+                    
+                    if self.use_local_parser:
+                        local = parse_sheet_locally(sheet_text, self.equipo_value)
+                        if local["confiable"]:
+                            sheet["registros"] = local["registros"]
+                            continue
+                    if self.cache is not None:
+                        sheet["cache_key"] = self.cache.make_key(sheet_text, self.model, self.equipo_value)
+                    
+                    context, rows = self.prompt_sections(sheet_text)
+                    blocks = [rows[i:i + ROWS_PER_CHUNK] for i in range(0, len(rows), ROWS_PER_CHUNK)] or [[]]
+                    for chunk_index, block in enumerate(blocks):
+                        custom_id = f"{workbook_id}-{sheet_index:03d}-{chunk_index:02d}"
+                        request = {
+                            "custom_id": custom_id,
+                            "method": "POST",
+                            "url": "/v1/chat/completions",
+                            "body": self.build_request_body("\n".join(context + block))
+                        }
+                        f.write(json.dumps(request, ensure_ascii=False) + "\n")
+                        sheet["custom_ids"].append(custom_id)
+                        total_requests += 1
+                
+                manifest["libros"].append(workbook)
+        
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        
+        print(f"📤 Lote exportado: {total_requests} solicitudes en {requests_path}")
+        print(f"   🗂️ Manifiesto: {manifest_path}")
+        return manifest_path
+    
+    def ingest_batch_results(self, results_path, manifest_path, output_dir="output"):
+        """
+        Importa el JSONL de resultados de la API de lotes y genera los JSON por operario
+        
+        Las respuestas pasan por la misma limpieza, parseo y validate_and_fix_times
+        que el modo interactivo.
+        
+        Args:
+            results_path (str): JSONL de resultados ({"custom_id", "response": {"status_code", "body"}, "error"})
+            manifest_path (str): Manifiesto generado por export_batch_requests
+            output_dir (str): Directorio de salida
+            
+        Returns:
+            list: Resultados de build_results por libro
+        """
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        responses = {}
+        usage_by_id = {}
+        with open(results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                custom_id = item.get("custom_id")
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code", 200) != 200:
+                    print(f"❌ {custom_id}: {item.get('error') or response.get('status_code')}")
+                    responses[custom_id] = ([], False)
+                    continue
+                
+                usage = response["body"].get("usage") or {}
+                usage_by_id[custom_id] = (usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+                choice = response["body"]["choices"][0]
+                rows, parsed = self.parse_response_rows(choice["message"].get("content") or "", custom_id)
+                responses[custom_id] = (rows, parsed and choice.get("finish_reason") != "length")
+        
+        all_results = []
+        for workbook in manifest["libros"]:
+            print(f"\n📥 Importando: {os.path.basename(workbook['archivo'])}")
+            extracted = []
+            for sheet in workbook["hojas"]:
+                stats = self.metrics.sheet(sheet["nombre"], workbook["archivo"])
+                if sheet["registros"] is not None:
+                    self.metrics.set(stats, fuente="local")
+                    self.metrics.add(stats, registros=len(sheet["registros"]))
+                    extracted.append((sheet["nombre"], sheet["registros"]))
+                    continue
+                
+                parts = [responses.get(custom_id, ([], False)) for custom_id in sheet["custom_ids"]]
+                missing = [cid for cid in sheet["custom_ids"] if cid not in responses]
+                if missing:
+                    print(f"⚠️ {sheet['nombre']}: sin respuesta para {', '.join(missing)}")
+                
+                records = self.validate_and_fix_times(merge_chunk_rows([rows for rows, _ in parts]))
+                complete = all(ok for _, ok in parts)
+                if self.cache is not None and sheet.get("cache_key") and records and complete:
+                    self.cache.set(sheet["cache_key"], records)
+                self.metrics.set(stats, fuente="batch")
+                self.metrics.add(stats, bloques=len(parts), registros=len(records),
+                                 fallos_parseo=sum(1 for _, ok in parts if not ok),
+                                 solicitudes=len(parts),
+                                 tokens_prompt=sum(usage_by_id.get(cid, (0, 0))[0] for cid in sheet["custom_ids"]),
+                                 tokens_respuesta=sum(usage_by_id.get(cid, (0, 0))[1] for cid in sheet["custom_ids"]))
+                extracted.append((sheet["nombre"], records))
+            
+            all_results.append(self.build_results(extracted, output_dir, workbook["archivo"]))
+        
+        print(f"📈 Métricas: {self.metrics.write(output_dir)}")
+        return all_results
+    
+    def process_directory(self, source, output_dir="output", processes=None):
+        """
+        Procesa en lote todos los libros de un directorio o patrón glob
+        
+        Los libros se leen en un pool de procesos y sus hojas pasan a la cola de
+        extracción compartida a medida que cada libro termina de leerse. Un
+        manifiesto (tamaño, mtime y hash) en output_dir permite omitir los
+        libros sin cambios desde la ejecución anterior.
+        
+        Args:
+            source (str): Directorio o patrón glob de libros
+            output_dir (str): Directorio de salida
+            processes (int): Procesos de lectura (None = número de CPUs)
+            
+        Returns:
+            dict: Resumen consolidado del lote
+        """
+        files = find_workbooks(source)
+        print(f"📦 Lote: {len(files)} libros encontrados en {source}")
+        
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            manifest = {}
+        
+        summary = []
+        to_process = {}
+        for path in files:
+            key = os.path.abspath(path)
+            stat = os.stat(path)
+            entry = manifest.get(key)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                summary.append({"archivo": path, "estado": "sin cambios", "archivo_json": entry.get("archivo_json")})
+                continue
+            
+            sha256 = file_sha256(path)
+            if entry and entry["sha256"] == sha256:
+                entry["mtime"] = stat.st_mtime
+                summary.append({"archivo": path, "estado": "sin cambios", "archivo_json": entry.get("archivo_json")})
+                continue
+            to_process[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+        
+        print(f"⚙️ {len(to_process)} libros nuevos o modificados, {len(files) - len(to_process)} sin cambios")
+        
+        # Lectura en procesos; extracción en la cola compartida del procesador
+        jobs = []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            cache_dir = self.workbook_cache.cache_dir if self.workbook_cache else None
+            reads = {pool.submit(load_workbook_sheets, path, cache_dir): path for path in to_process}
+            for read in as_completed(reads):
+                path = reads[read]
+                try:
+                    sheets, changes = read.result()
+                except Exception as e:
+                    print(f"❌ Error al leer {os.path.basename(path)}: {e}")
+                    summary.append({"archivo": path, "estado": "error", "error": str(e)})
+                    continue
+                print(f"📄 {os.path.basename(path)}: {len(sheets)} hojas en cola")
+                if changes:
+                    print(f"   🔍 {describe_sheet_changes(changes)}")
+                futures = []
+                for name, text, read_time in sheets:
+                    self.metrics.add(self.metrics.sheet(name, path), tiempo_lectura=read_time)
+                    futures.append((name, self.submit_sheet(text, name, path)))
+                jobs.append((path, futures))
+        
+        for path, futures in sorted(jobs):
+            print(f"\n🚀 Resultados de: {os.path.basename(path)}")
+            extracted = [(name, future.result()) for name, future in futures]
+            results = self.build_results(extracted, output_dir, path)
+            
+            if results["success"]:
+                manifest[os.path.abspath(path)] = dict(to_process[path], archivo_json=results["archivo_json"])
+                summary.append({
+                    "archivo": path,
+                    "estado": "procesado",
+                    "operario": results["operario"],
+                    "total_registros": results["total_registros"],
+                    "tiempo_total": results["tiempo_total"],
+                    "fechas_procesadas": sorted(results["fechas_procesadas"]),
+                    "archivo_json": results["archivo_json"]
+                })
+            else:
+                summary.append({"archivo": path, "estado": "error", "error": results["error"]})
+        
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        
+        summary.sort(key=lambda item: item["archivo"])
+        procesados = [item for item in summary if item["estado"] == "procesado"]
+        consolidated = {
+            "fuente": source,
+            "fecha_ejecucion": datetime.now().isoformat(timespec="seconds"),
+            "libros": len(files),
+            "procesados": len(procesados),
+            "sin_cambios": sum(1 for item in summary if item["estado"] == "sin cambios"),
+            "errores": sum(1 for item in summary if item["estado"] == "error"),
+            "total_registros": sum(item["total_registros"] for item in procesados),
+            "tiempo_total": sum(item["tiempo_total"] for item in procesados),
+            "metricas": self.metrics.summary(),
+            "detalle": summary
+        }
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        summary_file = os.path.join(output_dir, f"resumen_lote_{timestamp}.json")
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(consolidated, f, indent=2, ensure_ascii=False)
+        consolidated["archivo_resumen"] = summary_file
+        consolidated["archivo_metricas"] = self.metrics.write(output_dir)
+        
+        print(f"\n📦 LOTE COMPLETADO")
+        print(f"   ✅ Procesados: {consolidated['procesados']}")
+        print(f"   ⏭️ Sin cambios: {consolidated['sin_cambios']}")
+        print(f"   ❌ Errores: {consolidated['errores']}")
+        print(f"   📊 Registros: {consolidated['total_registros']}")
+        print(f"   💾 Resumen: {summary_file}")
+        
+        return consolidated
+
+def parse_args():
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Procesador de hojas de producción")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="No usar la caché de extracción")
+    parser.add_argument("--refrescar-cache", action="store_true",
+                        help="Volver a consultar OpenAI y reemplazar la caché")
+    parser.add_argument("--solo-openai", action="store_true",
+                        help="No usar el extractor local; enviar todas las hojas a OpenAI")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Recibir las respuestas de OpenAI en streaming")
+    parser.add_argument("--lote", metavar="RUTA",
+                        help="Procesar sin preguntas todos los libros de un directorio o patrón glob")
+    parser.add_argument("--procesos", type=int, default=None,
+                        help="Procesos para leer libros en modo lote (por defecto: CPUs)")
+    parser.add_argument("--equipo", default=None,
+                        help="Valor del equipo (por defecto '30')")
+    parser.add_argument("--salida", default="output",
+                        help="Directorio de salida")
+    parser.add_argument("--exportar-batch", metavar="SOLICITUDES_JSONL",
+                        help="Generar el JSONL de solicitudes para la API de lotes en lugar de procesar")
+    parser.add_argument("--importar-batch", metavar="RESULTADOS_JSONL",
+                        help="Importar el JSONL de resultados de la API de lotes")
+    parser.add_argument("--manifiesto-batch", metavar="MANIFIESTO",
+                        help="Manifiesto generado al exportar (requerido con --importar-batch)")
+    parser.add_argument("--compactar", action="store_true",
+                        help="Unir los registros repetidos antes de guardar (con auditoría de origen)")
+    parser.add_argument("--compactar-json", metavar="JSON",
+                        help="Compactar un JSON de registros ya generado y terminar")
+    parser.add_argument("--reporte-tokens", action="store_true",
+                        help="Comparar los tokens de entrada por hoja (prompt anterior y compacto) sin consultar la API")
+    return parser.parse_args()
+
+
 def main():
     """Función principal"""
+    args = parse_args()
+    
     print("🔧 PROCESADOR DE HOJAS DE PRODUCCIÓN")
     print("=" * 50)
     
@@ -313,28 +2315,78 @@ def main():
     
     api_key = os.getenv("api_key")
     
+    # Compactar un JSON existente no consulta la API
+    if args.compactar_json:
+        output_file, audit_file = compact_json_file(args.compactar_json)
+        print(f"💾 Guardado en: {output_file}")
+        print(f"🔎 Auditoría: {audit_file}")
+        return
+    
+    # El reporte de tokens no consulta la API
+    if args.reporte_tokens:
+        files = find_workbooks(args.lote) if args.lote else [input("📁 Ruta del archivo Excel: ").strip()]
+        processor = ExcelProductionProcessor(api_key or "no-requerida", args.equipo or "30")
+        print(f"💾 Reporte: {processor.token_report(files, args.salida)}")
+        return
+    
+    # Importar resultados de lotes no consulta la API
+    if args.importar_batch:
+        if not args.manifiesto_batch:
+            print("❌ ERROR: --importar-batch requiere --manifiesto-batch")
+            return
+        processor = ExcelProductionProcessor(api_key or "no-requerida", args.equipo or "30",
+                                             compact=args.compactar)
+        processor.ingest_batch_results(args.importar_batch, args.manifiesto_batch, args.salida)
+        return
+    
     if not api_key or api_key == "tu-api-key-aqui":
         print("❌ ERROR: Debes configurar tu API Key de OpenAI")
         print("Edita la línea 'api_key = \"tu-api-key-aqui\"' con tu clave real")
         return
     
-    # Archivo a procesar
-    file_path = input("📁 Ruta del archivo Excel (o Enter para usar archivo por defecto): ").strip()
-    if not file_path:
-        file_path = "HOJA DE PRODUCCION ADMON 31-03 AL 23-05 NELSON RANGEL.xlsx"
-    
-    if not os.path.exists(file_path):
-        print(f"❌ Archivo no encontrado: {file_path}")
-        return
+    # Archivo a procesar (no se pregunta en modo lote)
+    file_path = None
+    if not args.lote:
+        file_path = input("📁 Ruta del archivo Excel (o Enter para usar archivo por defecto): ").strip()
+        if not file_path:
+            file_path = "HOJA DE PRODUCCION ADMON 31-03 AL 23-05 NELSON RANGEL.xlsx"
+        
+        if not os.path.exists(file_path):
+            print(f"❌ Archivo no encontrado: {file_path}")
+            return
     
     # Valor del equipo
-    equipo_value = input("⚙️ Valor del equipo (Enter para usar '30'): ").strip()
+    equipo_value = args.equipo
+    if equipo_value is None and not args.lote:
+        equipo_value = input("⚙️ Valor del equipo (Enter para usar '30'): ").strip()
     if not equipo_value:
         equipo_value = "30"
     
+    # Concurrencia y límites de la API (opcionales en .env)
+    max_workers = int(os.getenv("max_workers", "4"))
+    requests_per_minute = int(os.getenv("requests_per_minute", "0")) or None
+    tokens_per_minute = int(os.getenv("tokens_per_minute", "0")) or None
+    
     # Procesar
-    processor = ExcelProductionProcessor(api_key, equipo_value)
-    results = processor.process_excel_file(file_path)
+    processor = ExcelProductionProcessor(api_key, equipo_value, max_workers=max_workers,
+                                         requests_per_minute=requests_per_minute,
+                                         tokens_per_minute=tokens_per_minute,
+                                         use_cache=not args.sin_cache,
+                                         refresh_cache=args.refrescar_cache,
+                                         use_local_parser=not args.solo_openai,
+                                         streaming=args.streaming,
+                                         compact=args.compactar)
+    try:
+        if args.exportar_batch:
+            files = find_workbooks(args.lote) if args.lote else [file_path]
+            processor.export_batch_requests(files, args.exportar_batch)
+            return
+        if args.lote:
+            processor.process_directory(args.lote, args.salida, processes=args.procesos)
+            return
+        results = processor.process_excel_file(file_path, args.salida)
+    finally:
+        processor.close()
     
     if not results["success"]:
         print(f"❌ Error: {results.get('error', 'Error desconocido')}")
@@ -0,0 +1,443 @@
+import argparse
+import importlib.util
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(file_name, module_name):
+    """Importa uno de los scripts del proyecto (sus nombres tienen espacios)"""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(BASE_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+extractor = load_script("Extractor de excel.py", "extractor_de_excel")
+registro = load_script("Registro de datos.py", "registro_de_datos")
+
+# Marca de fin de cola entre etapas
+STOP = object()
+
+
+class StageStats:
+    def __init__(self, name):
+        """Contadores de una etapa (thread-safe)"""
+        self.name = name
+        self.entradas = 0
+        self.salidas = 0
+        self.errores = 0
+        self.ocupado = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, salidas=0, errores=0, segundos=0.0):
+        with self._lock:
+            self.entradas += 1
+            self.salidas += salidas
+            self.errores += errores
+            self.ocupado += segundos
+
+    def line(self, elapsed):
+        rate = self.salidas / elapsed * 60 if elapsed else 0
+        return (f"{self.name:<10} entradas {self.entradas:>5}  salidas {self.salidas:>6}  "
+                f"errores {self.errores:>4}  {rate:>8.1f}/min  ocupado {self.ocupado:>7.1f}s")
+
+    def to_dict(self):
+        return {"entradas": self.entradas, "salidas": self.salidas,
+                "errores": self.errores, "segundos_ocupado": round(self.ocupado, 2)}
+
+
+class Stage:
+    def __init__(self, name, func, workers, inbox, outbox=None):
+        """
+        Etapa del pipeline: `workers` hilos toman elementos de `inbox`, aplican
+        `func` (que devuelve una lista de salidas) y las ponen en `outbox`.
+        Las colas son acotadas: si `outbox` se llena, la etapa espera.
+
+        Args:
+            name (str): Nombre para los contadores
+            func (callable): Recibe un elemento y devuelve una lista (o un generador)
+                de salidas; las de un generador pasan a `outbox` a medida que se producen
+            workers (int): Hilos de la etapa
+            inbox (queue.Queue): Cola de entrada
+            outbox (queue.Queue): Cola de salida (None en la última etapa)
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stats = StageStats(name)
+        self.next_workers = 1
+        self._threads = []
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is STOP:
+                return
+            start = time.perf_counter()
+            count, errors = 0, 0
+            try:
+                for output in self.func(item) or []:
+                    count += 1
+                    if self.outbox is not None:
+                        self.outbox.put(output)
+            except Exception as e:
+                print(f"❌ [{self.name}] {e}")
+                errors = 1
+            self.stats.add(count, errors, time.perf_counter() - start)
+
+    def _supervise(self):
+        for thread in self._threads:
+            thread.join()
+        # La etapa terminó: avisar a cada hilo de la siguiente
+        if self.outbox is not None:
+            for _ in range(self.next_workers):
+                self.outbox.put(STOP)
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self.supervisor.start()
+
+
+class HttpSink:
+    workers_limit = None
+
+    def __init__(self, url, username, password, form_url=None, op_options_url=None, workers=4):
+        """Destino de envío por HTTP (ver HttpFormSubmitter)"""
+        self.credentials = (url, username, password)
+        self.submitter = registro.HttpFormSubmitter(form_url=form_url, op_options_url=op_options_url,
+                                                    workers=workers)
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _ensure_ready(self):
+        with self._lock:
+            if not self._ready:
+                if not self.submitter.login(*self.credentials):
+                    raise RuntimeError("login fallido")
+                self.submitter.load_form()
+                self._ready = True
+
+    def option_lists(self, fecha):
+        self._ensure_ready()
+        return self.submitter.load_option_lists([fecha])
+
+    def submit(self, record, on_submit=None):
+        self._ensure_ready()
+        return self.submitter.submit(record, on_submit)
+
+    def close(self):
+        self.submitter.close()
+
+
+class BrowserSink:
+    # Un navegador no admite dos registros a la vez
+    workers_limit = 1
+
+    def __init__(self, url, username, password, **browser_options):
+        """Destino de envío con FormAutomation (una sola sesión)"""
+        self.credentials = (url, username, password)
+        self.browser_options = browser_options
+        self.automation = None
+        self._option_lists = {}
+        self._lock = threading.Lock()
+
+    def _ensure_ready(self):
+        if self.automation is None:
+            self.automation = registro.FormAutomation(**self.browser_options)
+            if not self.automation.login(*self.credentials):
+                raise RuntimeError("login fallido")
+
+    def option_lists(self, fecha):
+        with self._lock:
+            self._ensure_ready()
+            if fecha not in self._option_lists:
+                self._option_lists[fecha] = self.automation.load_option_lists([fecha])
+            return self._option_lists[fecha]
+
+    def submit(self, record, on_submit=None):
+        with self._lock:
+            self._ensure_ready()
+            return self.automation.register_record(record, on_submit)
+
+    def close(self):
+        if self.automation is not None:
+            self.automation.wait_stats.report()
+            self.automation.close()
+
+
+class DryRunSink:
+    workers_limit = None
+
+    def option_lists(self, fecha):
+        return None
+
+    def submit(self, record, on_submit=None):
+        """Sin envío: solo se escribe el JSONL de la ejecución"""
+        return {"ok": True, "registro": record, "error": None, "segundos": 0.0}
+
+    def close(self):
+        pass
+
+
+class Pipeline:
+    def __init__(self, processor, sink, output_dir="output", ledger=None, compact=True, validate=True,
+                 read_workers=2, extract_workers=4, validate_workers=2, submit_workers=4, queue_size=50):
+        """
+        Pipeline libro → hojas → registros → SCP con colas acotadas entre etapas:
+        leer, extraer (incluye validación y reparto de tiempos), compactar,
+        validar contra las opciones del formulario y enviar.
+
+        Args:
+            processor: ExcelProductionProcessor del extractor
+            sink: Destino de envío (HttpSink, BrowserSink o DryRunSink)
+            output_dir (str): Carpeta del JSONL y los reportes de la ejecución
+            ledger: SubmissionLedger para no repetir registros confirmados
+            compact (bool): Unir registros repetidos de cada hoja
+            validate (bool): Validar OP, operario y equipo antes de enviar
+            read_workers, extract_workers, validate_workers, submit_workers (int):
+                Hilos de cada etapa
+            queue_size (int): Capacidad de cada cola entre etapas
+        """
+        self.processor = processor
+        self.sink = sink
+        self.output_dir = output_dir
+        self.ledger = ledger
+        self.compact = compact
+        self.validate = validate and not isinstance(sink, DryRunSink)
+        # La compactación necesita la hoja completa: sin ella los registros se envían al llegar
+        self.stream_records = processor.streaming and not compact
+        self.problems = []
+        self.results = []
+        # Apariciones por clave de cada (libro, hoja), ver registro.number_repeats
+        self._repeats = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.records_path = os.path.join(output_dir, f"pipeline_{timestamp}.jsonl")
+        self.report_path = os.path.join(output_dir, f"pipeline_{timestamp}_resumen.json")
+        self._records_file = open(self.records_path, 'a', encoding='utf-8')
+
+        if sink.workers_limit:
+            submit_workers = min(submit_workers, sink.workers_limit)
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(5)]
+        steps = [
+            ("leer", self.read_workbook, read_workers),
+            ("extraer", self.stream_sheet if self.stream_records else self.extract_sheet, extract_workers),
+            ("compactar", self.compact_sheet, 1),
+            ("validar", self.validate_record, validate_workers),
+            ("enviar", self.submit_record, submit_workers),
+        ]
+        self.stages = []
+        for i, (name, func, workers) in enumerate(steps):
+            outbox = self.queues[i + 1] if i + 1 < len(self.queues) else None
+            self.stages.append(Stage(name, func, workers, self.queues[i], outbox))
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.next_workers = following.workers
+
+    def read_workbook(self, file_path):
+        """Etapa leer: hojas de un libro (de la caché de libros si no cambió)"""
+        cache_dir = self.processor.workbook_cache.cache_dir if self.processor.workbook_cache else None
+        sheets, changes = extractor.load_workbook_sheets(file_path, cache_dir)
+        print(f"📄 {os.path.basename(file_path)}: {len(sheets)} hojas "
+              f"({extractor.describe_sheet_changes(changes) or 'sin caché'})")
+        return [(file_path, name, text) for name, text, _ in sheets]
+
+    def extract_sheet(self, item):
+        """Etapa extraer: registros con tiempos ya validados y repartidos"""
+        file_path, name, text = item
+        records = self.processor.extract_sheet(text, name, file_path)
+        return [(file_path, name, records)] if records else []
+
+    def stream_sheet(self, item):
+        """Etapa extraer en streaming: cada registro pasa a la siguiente etapa en cuanto llega"""
+        file_path, name, text = item
+        for record in self.processor.stream_sheet_records(text, name, file_path):
+            yield file_path, name, [record]
+
+    def compact_sheet(self, item):
+        """
+        Etapa compactar: une registros repetidos de la hoja y los escribe al JSONL.
+        Los que quedan repetidos se numeran dentro de su hoja (un solo hilo, antes
+        del envío en paralelo): la misma hoja en otra versión del libro produce las
+        mismas claves del libro de envíos y no se reenvía
+        """
+        file_path, name, records = item
+        if self.compact:
+            records, _ = extractor.compact_records([(name, records)])
+        records = registro.number_repeats(records, self._repeats.setdefault((file_path, name), {}))
+        with self._lock:
+            for record in records:
+                self._records_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._records_file.flush()
+        return records
+
+    def validate_record(self, record):
+        """Etapa validar: descarta registros sin opción válida en el formulario"""
+        if not self.validate:
+            return [record]
+        clean, problems = registro.validate_records([record], self.sink.option_lists(record.get("fecha")))
+        if problems:
+            with self._lock:
+                self.problems.extend(problems)
+            print(f"⚠️ Registro descartado: {problems[0]['problemas']}")
+        return clean
+
+    def submit_record(self, record):
+        """Etapa enviar: registra en el SCP y anota el resultado en el libro"""
+        # Reserva atómica: el mismo registro en otro hilo no se envía dos veces
+        if self.ledger is not None and not self.ledger.claim(record):
+            return []
+        result = self.sink.submit(record)
+        if self.ledger is not None:
+            self.ledger.record(result)
+        with self._lock:
+            self.results.append(result)
+        if not result["ok"]:
+            raise RuntimeError(f"{record.get('fecha')} OP {record.get('OP')}: {result['error']}")
+        return [result]
+
+    def run(self, files, report_interval=10):
+        """
+        Ejecuta el pipeline sobre una lista de libros
+
+        Returns:
+            dict: Resumen con los contadores de cada etapa
+        """
+        start = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        for file_path in files:
+            self.queues[0].put(file_path)
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(STOP)
+
+        last = self.stages[-1]
+        while last.supervisor.is_alive():
+            last.supervisor.join(timeout=report_interval)
+            if last.supervisor.is_alive():
+                self.print_counters(time.perf_counter() - start)
+
+        elapsed = time.perf_counter() - start
+        self._records_file.close()
+        self.sink.close()
+        print("\n📊 Resumen del pipeline")
+        self.print_counters(elapsed)
+        return self.write_report(files, elapsed)
+
+    def print_counters(self, elapsed):
+        print(f"⏱️ {elapsed:.1f}s")
+        for stage in self.stages:
+            print(f"   {stage.stats.line(elapsed)}")
+
+    def write_report(self, files, elapsed):
+        summary = {
+            "fecha_ejecucion": datetime.now().isoformat(timespec="seconds"),
+            "libros": files,
+            "segundos": round(elapsed, 2),
+            "etapas": {stage.name: stage.stats.to_dict() for stage in self.stages},
+            "enviados": sum(1 for result in self.results if result["ok"]),
+            "fallidos": sum(1 for result in self.results if not result["ok"]),
+            "descartados_validacion": self.problems,
+            "archivo_registros": self.records_path,
+            "metricas_extraccion": self.processor.metrics.summary(),
+        }
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"💾 Registros: {self.records_path}")
+        print(f"💾 Resumen: {self.report_path}")
+        return summary
+
+
+def parse_args():
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Pipeline completo: libros de Excel → registros → SCP")
+    parser.add_argument("libros", help="Libro, directorio o patrón glob de libros")
+    parser.add_argument("--motor", choices=("http", "navegador", "ninguno"), default="ninguno",
+                        help="Cómo enviar al SCP (por defecto 'ninguno': solo extraer y escribir el JSONL)")
+    parser.add_argument("--equipo", default="30", help="Valor del equipo (por defecto '30')")
+    parser.add_argument("--salida", default="output", help="Directorio de salida")
+    parser.add_argument("--hilos-lectura", type=int, default=2, help="Libros leídos a la vez")
+    parser.add_argument("--hilos-extraccion", type=int, default=None,
+                        help="Hojas extraídas a la vez (por defecto max_workers de .env)")
+    parser.add_argument("--hilos-validacion", type=int, default=2, help="Registros validados a la vez")
+    parser.add_argument("--hilos-envio", type=int, default=4,
+                        help="Envíos simultáneos (el motor navegador siempre usa 1)")
+    parser.add_argument("--cola", type=int, default=50, help="Capacidad de cada cola entre etapas")
+    parser.add_argument("--sin-compactar", action="store_true", help="No unir registros repetidos")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Recibir las respuestas de OpenAI en streaming; con --sin-compactar cada "
+                             "registro se valida y envía en cuanto llega")
+    parser.add_argument("--sin-validar", action="store_true",
+                        help="No validar contra las opciones del formulario")
+    parser.add_argument("--sin-libro", action="store_true", help="No usar el libro de envíos")
+    parser.add_argument("--intervalo", type=float, default=10, help="Segundos entre reportes de avance")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    files = extractor.find_workbooks(args.libros)
+    if not files:
+        print(f"❌ No se encontraron libros en {args.libros}")
+        return
+
+    api_key = os.getenv("api_key")
+    if not api_key:
+        print("⚠️ Sin api_key en .env: solo se procesarán las hojas que resuelve el extractor local")
+    max_workers = int(os.getenv("max_workers", "4"))
+    processor = extractor.ExcelProductionProcessor(
+        api_key or "no-requerida", args.equipo, max_workers=max_workers,
+        requests_per_minute=int(os.getenv("requests_per_minute", "0")) or None,
+        tokens_per_minute=int(os.getenv("tokens_per_minute", "0")) or None,
+        streaming=args.streaming,
+    )
+
+    # Acceso al SCP (opcional en .env)
+    url = os.getenv("scp_url", "http://192.168.1.85:8181/scp/render.php?frm=acceso.logIn")
+    username = os.getenv("scp_usuario", "admin")
+    password = os.getenv("scp_contrasena", "123")
+    if args.motor == "http":
+        sink = HttpSink(url, username, password, form_url=os.getenv("scp_form_url"),
+                        op_options_url=os.getenv("scp_ops_url"), workers=args.hilos_envio)
+    elif args.motor == "navegador":
+        sink = BrowserSink(url, username, password, headless=True, fast=True)
+    else:
+        sink = DryRunSink()
+
+    use_ledger = args.motor != "ninguno" and not args.sin_libro
+    ledger = registro.SubmissionLedger(registro.LEDGER_FILE) if use_ledger else None
+    pipeline = Pipeline(
+        processor, sink, output_dir=args.salida, ledger=ledger,
+        compact=not args.sin_compactar, validate=not args.sin_validar,
+        read_workers=args.hilos_lectura, extract_workers=args.hilos_extraccion or max_workers,
+        validate_workers=args.hilos_validacion, submit_workers=args.hilos_envio, queue_size=args.cola,
+    )
+    print(f"🔧 Pipeline: {len(files)} libros, motor {args.motor}")
+    try:
+        pipeline.run(files, report_interval=args.intervalo)
+    finally:
+        processor.close()
+        if ledger is not None:
+            ledger.close()
+
+
+if __name__ == "__main__":
+    main()
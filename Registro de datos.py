@@ -1,72 +1,1109 @@
+import hashlib
 import json
+import os
+import queue
+import re
+import sqlite3
 import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, SessionNotCreatedException
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
+# Tiempos máximos de espera (segundos) por tipo de condición
+DEFAULT_TIMEOUTS = {
+    "elemento": 10,      # Campos y botones presentes/clicables
+    "recarga_ops": 5,    # Opciones de cboOPF recargadas tras cambiar la fecha
+    "envio": 10,         # Confirmación después de "Adicionar"
+}
+
+# Firma del contenido de un select (valores de sus opciones) en una sola llamada
+OPTIONS_SIGNATURE_SCRIPT = """
+var select = document.getElementsByName(arguments[0])[0];
+if (!select) { return null; }
+return Array.prototype.map.call(select.options, function (o) { return o.value; }).join('|');
+"""
+
+# Firma de cboOPF y peticiones AJAX de jQuery en curso (-1 si la página no usa jQuery)
+OP_RELOAD_STATE_SCRIPT = """
+var select = document.getElementsByName('cboOPF')[0];
+var signature = select ? Array.prototype.map.call(select.options, function (o) { return o.value; }).join('|') : null;
+var pending = (typeof jQuery !== 'undefined') ? jQuery.active : -1;
+return [signature, pending];
+"""
+
+ROW_COUNT_SCRIPT = "return document.getElementsByTagName('tr').length;"
+
+# Llena el formulario completo en una sola llamada asíncrona. Dispara los mismos
+# eventos que el teclado (focus, input, change, blur) y, si la fecha cambió, espera
+# la recarga de cboOPF antes de elegir la OP. Devuelve un reporte por campo.
+FILL_FORM_SCRIPT = """
+var record = arguments[0], fechaCambio = arguments[1], opTimeout = arguments[2];
+var done = arguments[arguments.length - 1];
+var report = {};
+
+function byName(name) { return document.getElementsByName(name)[0]; }
+function fire(el, types) {
+    types.forEach(function (type) { el.dispatchEvent(new Event(type, {bubbles: true})); });
+}
+function norm(text) { return (text || '').replace(/\\s+/g, ' ').trim().toLowerCase(); }
+function signature() {
+    var el = byName('cboOPF');
+    return el ? Array.prototype.map.call(el.options, function (o) { return o.value; }).join('|') : null;
+}
+function setText(name, value) {
+    var el = byName(name);
+    if (!el) { report[name] = {ok: false, error: 'campo no encontrado'}; return; }
+    el.focus();
+    el.value = value;
+    fire(el, ['input', 'change']);
+    el.blur();
+    fire(el, ['blur']);
+    report[name] = {ok: el.value === String(value)};
+}
+function selectPartial(name, text) {
+    var el = byName(name);
+    if (!el) { report[name] = {ok: false, error: 'campo no encontrado'}; return; }
+    var target = norm(String(text)), found = -1;
+    // Mismo orden que OptionIndex: texto exacto, prefijo y luego subcadena
+    var tests = [
+        function (t) { return t === target; },
+        function (t) { return t.indexOf(target) === 0; },
+        function (t) { return t.indexOf(target) !== -1; }
+    ];
+    for (var k = 0; k < tests.length && found === -1 && target; k++) {
+        for (var i = 0; i < el.options.length; i++) {
+            if (tests[k](norm(el.options[i].text))) { found = i; break; }
+        }
+    }
+    if (found === -1) {
+        report[name] = {ok: false, error: "sin opción que contenga '" + text + "'"};
+        return;
+    }
+    el.focus();
+    el.selectedIndex = found;
+    fire(el, ['input', 'change']);
+    el.blur();
+    report[name] = {ok: true, opcion: el.options[found].text};
+}
+function fillRest() {
+    selectPartial('cboOPF', record.OP);
+    selectPartial('cboOperario', record.operario);
+    setText('txtActividad', record.actividad);
+    setText('txtTiempoOrdinario', record.tiempo_ordinario);
+    if (record.tiempo_extra) { setText('txtTiempoExtra', record.tiempo_extra); }
+    selectPartial('cboEquipo', record.equipo);
+    done(report);
+}
+
+var before = signature();
+setText('fecha', record.fecha);
+if (!fechaCambio) { fillRest(); return; }
+
+var start = Date.now(), ajaxSeen = false;
+(function waitForOps() {
+    var current = signature();
+    var pending = (typeof jQuery !== 'undefined') ? jQuery.active : -1;
+    if (pending > 0) { ajaxSeen = true; }
+    var reloaded = (current && current !== before) || (ajaxSeen && pending === 0 && current);
+    if (reloaded || Date.now() - start > opTimeout) { fillRest(); }
+    else { setTimeout(waitForOps, 50); }
+})();
+"""
+
+
+# Todas las opciones de un select como pares [valor, texto] en una sola llamada
+OPTIONS_SCRIPT = """
+return Array.prototype.map.call(arguments[0].options, function (o) { return [o.value, o.text]; });
+"""
+
+
+def normalize_option_text(text):
+    """Texto de opción en minúsculas y con espacios simples"""
+    return " ".join(str(text).split()).lower()
+
+
+# Fragmentos de las alertas con las que el SCP confirma o rechaza un registro.
+# Una alerta que no coincide con ninguno deja el registro sin confirmar: no se
+# reenvía automáticamente (podría estar guardado) y queda para revisión
+SUCCESS_ALERT_MESSAGES = ("con éxito", "con exito", "exitosamente", "correctamente")
+ERROR_ALERT_MESSAGES = ("error", "no válid", "no valid", "inválid", "invalid", "campos",
+                        "obligatori", "no existe", "no se pudo", "incorrect")
+
+
+def classify_alert(text):
+    """
+    Clasifica el texto de una alerta del SCP
+    
+    Returns:
+        bool: True si confirma el registro, False si lo rechaza, None si no se reconoce
+    """
+    text = normalize_option_text(text or "")
+    if any(message in text for message in ERROR_ALERT_MESSAGES):
+        return False
+    if any(message in text for message in SUCCESS_ALERT_MESSAGES):
+        return True
+    return None
+
+
+# alert('...') o alert("...") en la página que devuelve el SCP
+ALERT_RE = re.compile(r"""alert\(\s*(['"])(.*?)\1\s*\)""", re.S)
+TAG_RE = re.compile(r"<script.*?</script>|<[^>]+>", re.S | re.I)
+
+
+def parse_submission_response(response):
+    """
+    Interpreta la respuesta del SCP a "Adicionar". Un 200 no basta: el SCP
+    devuelve los errores de validación en una página normal
+    
+    Args:
+        response (requests.Response): Respuesta del POST
+        
+    Returns:
+        tuple: (ok, confirmado, error). Si la página no trae una alerta o un
+            mensaje reconocido el envío queda sin confirmar (requiere revisión)
+    """
+    if "json" in response.headers.get("Content-Type", ""):
+        data = response.json()
+        if isinstance(data, dict) and data.get("ok"):
+            return True, True, None
+        error = data.get("error") if isinstance(data, dict) else None
+        return False, False, f"el SCP rechazó el registro: {error or response.status_code}"
+    
+    response.raise_for_status()
+    alerts = [unescape(match.group(2)) for match in ALERT_RE.finditer(response.text)]
+    verdicts = [classify_alert(text) for text in alerts]
+    if False in verdicts:
+        return False, False, f"el SCP rechazó el registro: {alerts[verdicts.index(False)]}"
+    if None in verdicts:
+        return True, False, f"alerta no reconocida: {alerts[verdicts.index(None)]}"
+    page_text = normalize_option_text(unescape(TAG_RE.sub(" ", response.text)))
+    if alerts or any(message in page_text for message in SUCCESS_ALERT_MESSAGES):
+        return True, True, None
+    return True, False, "la respuesta no confirma el registro"
+
+
+class OptionIndex:
+    def __init__(self, options):
+        """
+        Índice en memoria de las opciones de un select
+        
+        Args:
+            options (list): Pares (valor, texto) en el orden del select
+        """
+        self.options = [(value, text, normalize_option_text(text)) for value, text in options]
+        self.by_text = {}
+        for value, text, normalized in self.options:
+            self.by_text.setdefault(normalized, (value, text))
+
+    def matches(self, partial_text):
+        """
+        Opciones que coinciden, en el primer nivel con resultados:
+        texto exacto, luego prefijo y por último subcadena
+        
+        Args:
+            partial_text (str): Texto buscado
+            
+        Returns:
+            list: Pares (valor, texto)
+        """
+        target = normalize_option_text(partial_text)
+        if not target:
+            return []
+        if target in self.by_text:
+            return [self.by_text[target]]
+        prefix = [(value, text) for value, text, normalized in self.options if normalized.startswith(target)]
+        if prefix:
+            return prefix
+        return [(value, text) for value, text, normalized in self.options if target in normalized]
+
+    def lookup(self, partial_text):
+        """
+        Mejor opción para un texto
+        
+        Returns:
+            tuple: (valor, texto) o None si no hay coincidencias
+        """
+        found = self.matches(partial_text)
+        return found[0] if found else None
+
+
+# Campo del registro JSON -> nombre del campo en el formulario del SCP
+FORM_FIELDS = {
+    "fecha": "fecha",
+    "OP": "cboOPF",
+    "operario": "cboOperario",
+    "actividad": "txtActividad",
+    "tiempo_ordinario": "txtTiempoOrdinario",
+    "tiempo_extra": "txtTiempoExtra",
+    "equipo": "cboEquipo",
+}
+SELECT_FIELDS = ("OP", "operario", "equipo")
+
+
+def load_json_records(json_file_path):
+    """
+    Carga los registros generados por el extractor (formato común de los motores de registro)
+    
+    Args:
+        json_file_path (str): Ruta al archivo JSON
+        
+    Returns:
+        list: Registros, o lista vacía si el archivo no existe o no es válido
+    """
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        print(f"Datos cargados exitosamente: {len(data)} registros")
+        return data
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo {json_file_path}")
+        return []
+    except json.JSONDecodeError:
+        print("Error: El archivo JSON no tiene formato válido")
+        return []
+
+
+class FormPageParser(HTMLParser):
+    """Extrae de una página los formularios con sus campos, selects y botones"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self._form = None
+        self._select = None
+        self._option = None
+
+    def _current_form(self):
+        # Campos fuera de un <form> se agrupan en un formulario implícito
+        if self._form is None:
+            self._form = {"action": "", "method": "get", "inputs": {}, "selects": {}, "submits": []}
+            self.forms.append(self._form)
+        return self._form
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+        if tag == "form":
+            self._form = {
+                "action": attrs.get("action", ""),
+                "method": attrs.get("method", "get").lower(),
+                "inputs": {},
+                "selects": {},
+                "submits": [],
+            }
+            self.forms.append(self._form)
+        elif tag in ("input", "textarea"):
+            name = attrs.get("name")
+            input_type = attrs.get("type", "text").lower()
+            if input_type in ("submit", "button", "image"):
+                self._current_form()["submits"].append((name, attrs.get("value", "")))
+            elif name and (input_type not in ("checkbox", "radio") or "checked" in attrs):
+                self._current_form()["inputs"][name] = attrs.get("value", "")
+        elif tag == "button":
+            self._current_form()["submits"].append((attrs.get("name"), attrs.get("value", "")))
+        elif tag == "select" and attrs.get("name"):
+            self._select = attrs["name"]
+            self._current_form()["selects"][self._select] = []
+        elif tag == "option" and self._select is not None:
+            self._option = [attrs.get("value"), ""]
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option[1] += data
+
+    def handle_endtag(self, tag):
+        if tag == "option" and self._option is not None:
+            self._close_option()
+        elif tag == "select":
+            if self._option is not None:
+                self._close_option()
+            self._select = None
+        elif tag == "form":
+            self._form = None
+
+    def _close_option(self):
+        value, text = self._option
+        self._current_form()["selects"][self._select].append(
+            (text.strip() if value is None else value, text.strip())
+        )
+        self._option = None
+
+    @classmethod
+    def parse(cls, html):
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        return parser.forms
+
+
+def parse_options_html(html):
+    """Opciones (valor, texto) de un fragmento HTML con <option>, ej: la recarga de cboOPF"""
+    parser = FormPageParser()
+    parser._select = "opciones"
+    parser._current_form()["selects"]["opciones"] = []
+    parser.feed(html)
+    parser.close()
+    return parser.forms[0]["selects"]["opciones"]
+
+
+# Ruta del chromedriver ya descargado, para no consultar versiones en cada inicio
+DRIVER_PATH_CACHE = ".cache/chromedriver_path"
+# Recursos que el modo rápido no descarga (el formulario funciona sin ellos)
+BLOCKED_RESOURCES = [
+    "*.css", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+]
+
+LEDGER_FILE = "output/registro_envios.sqlite3"
+# Estados del libro de envíos
+CONFIRMED = "confirmado"
+FAILED = "fallido"
+SENDING = "enviando"
+UNCONFIRMED = "sin_confirmar"
+
+
+def resolve_driver_path(driver_path=None, cache_file=DRIVER_PATH_CACHE, refresh=False):
+    """
+    Ruta del chromedriver: la indicada, la guardada en caché si el archivo aún
+    existe, o la que descarga webdriver-manager (que se guarda para la próxima vez)
+    
+    Args:
+        driver_path (str): Ruta explícita (se usa tal cual)
+        cache_file (str): Archivo con la ruta guardada
+        refresh (bool): Ignorar la ruta guardada y resolver de nuevo con webdriver-manager
+    
+    Returns:
+        str: Ruta al ejecutable
+    """
+    if driver_path:
+        return driver_path
+    if not refresh:
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = f.read().strip()
+            if cached and os.path.exists(cached):
+                return cached
+        except FileNotFoundError:
+            pass
+
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        f.write(path)
+    return path
+
+
+def record_key(record):
+    """
+    Clave estable de un registro: hash de (fecha, OP, operario, actividad, tiempos)
+    
+    Returns:
+        str: sha256 en hexadecimal
+    """
+    fields = [
+        record.get("fecha"), record.get("OP"), record.get("operario"), record.get("actividad"),
+        record.get("tiempo_ordinario"), record.get("tiempo_extra"),
+    ]
+    normalized = [" ".join(str(value or "").split()).lower() for value in fields]
+    if record.get("repeticion"):
+        normalized.append(str(record["repeticion"]))
+    return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+
+def number_repeats(records, counts=None):
+    """
+    Numera los registros idénticos de una misma entrada (la misma reunión anotada
+    dos veces el mismo día es trabajo real) para que cada uno tenga su propia
+    clave en el libro de envíos
+    
+    Args:
+        records (list): Registros
+        counts (dict): Apariciones ya vistas por clave, para numerar un flujo de registros
+        
+    Returns:
+        list: Registros; cada repetición es una copia con "repeticion" = 1, 2, ...
+    """
+    counts = {} if counts is None else counts
+    numbered = []
+    for record in records:
+        key = record_key(record)
+        seen = counts.get(key, 0)
+        counts[key] = seen + 1
+        numbered.append(dict(record, repeticion=seen) if seen else record)
+    return numbered
+
+
+class SubmissionLedger:
+    def __init__(self, path=LEDGER_FILE):
+        """
+        Libro de envíos en SQLite: cada registro queda como confirmado, fallido o
+        sin confirmar, para reanudar una carga interrumpida sin repetir envíos
+        
+        Args:
+            path (str): Archivo de la base de datos
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS envios (
+                clave TEXT PRIMARY KEY,
+                fecha TEXT, op TEXT, operario TEXT, actividad TEXT,
+                estado TEXT NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                segundos REAL,
+                actualizado TEXT
+            )"""
+        )
+        self._conn.commit()
+
+    def _states(self, keys):
+        states = {}
+        keys = list(keys)
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT clave, estado FROM envios WHERE clave IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                states.update(rows)
+        return states
+
+    def pending(self, records, verbose=True):
+        """
+        Registros que faltan por enviar: omite los confirmados y los que quedaron
+        sin confirmar (requieren revisión). Los registros repetidos dentro de la
+        lista se numeran (ver number_repeats) y se envían todos
+        
+        Args:
+            records (list): Registros
+            verbose (bool): Imprimir el resumen
+            
+        Returns:
+            list: Registros pendientes o fallidos, en el orden original
+        """
+        records = number_repeats(records)
+        states = self._states(record_key(record) for record in records)
+        pending = []
+        skipped = {CONFIRMED: 0, UNCONFIRMED: 0}
+        for record in records:
+            state = states.get(record_key(record))
+            if state == CONFIRMED:
+                skipped[CONFIRMED] += 1
+            elif state in (SENDING, UNCONFIRMED):
+                skipped[UNCONFIRMED] += 1
+            else:
+                pending.append(record)
+
+        if not verbose:
+            return pending
+        print(f"Libro de envíos: {len(pending)} pendientes, {skipped[CONFIRMED]} ya confirmados")
+        if skipped[UNCONFIRMED]:
+            print(f"Advertencia: {skipped[UNCONFIRMED]} registros sin confirmar; revíselos en {self.path}")
+        return pending
+
+    def _upsert(self, record, state, error=None, seconds=None, attempt=False):
+        values = (
+            record_key(record), record.get("fecha"), str(record.get("OP")), record.get("operario"),
+            record.get("actividad"), state, int(attempt), error, seconds, datetime.now().isoformat(timespec="seconds"),
+        )
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO envios (clave, fecha, op, operario, actividad, estado, intentos, error, segundos, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(clave) DO UPDATE SET
+                    estado = excluded.estado,
+                    intentos = intentos + excluded.intentos,
+                    error = excluded.error,
+                    segundos = COALESCE(excluded.segundos, segundos),
+                    actualizado = excluded.actualizado""",
+                values,
+            )
+            self._conn.commit()
+
+    def claim(self, record):
+        """
+        Reserva un registro para enviarlo: lo marca como en envío solo si no está
+        confirmado ni en curso (seguro con varios hilos enviando a la vez)
+        
+        Returns:
+            bool: True si el registro se debe enviar
+        """
+        key = record_key(record)
+        with self._lock:
+            row = self._conn.execute("SELECT estado FROM envios WHERE clave = ?", (key,)).fetchone()
+            if row and row[0] in (CONFIRMED, SENDING, UNCONFIRMED):
+                return False
+            self._conn.execute(
+                """INSERT INTO envios (clave, fecha, op, operario, actividad, estado, intentos, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(clave) DO UPDATE SET estado = excluded.estado, intentos = intentos + 1,
+                    actualizado = excluded.actualizado""",
+                (key, record.get("fecha"), str(record.get("OP")), record.get("operario"), record.get("actividad"),
+                 SENDING, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._conn.commit()
+        return True
+
+    def mark_sending(self, record):
+        """Anota el registro justo antes de enviarlo (si el proceso muere queda sin confirmar)"""
+        self._upsert(record, SENDING, attempt=True)
+
+    def record(self, result):
+        """Guarda el resultado de un envío (ver FormAutomation.register_record)"""
+        if result["ok"]:
+            state = CONFIRMED if result.get("confirmado", True) else UNCONFIRMED
+        else:
+            state = FAILED
+        self._upsert(result["registro"], state, result.get("error"), result.get("segundos"))
+
+    def summary(self):
+        """
+        Returns:
+            dict: Número de registros por estado
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT estado, COUNT(*) FROM envios GROUP BY estado").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def validate_records(records, option_lists):
+    """
+    Compara cada registro con las opciones de cboOPF, cboOperario y cboEquipo
+    
+    Args:
+        records (list): Registros
+        option_lists (dict): {"OP": {fecha: OptionIndex}, "operario": OptionIndex, "equipo": OptionIndex}
+        
+    Returns:
+        tuple: (registros válidos, lista de problemas)
+    """
+    clean, problems = [], []
+    for position, record in enumerate(records):
+        record_problems = []
+        for field in SELECT_FIELDS:
+            index = option_lists["OP"].get(record.get("fecha")) if field == "OP" else option_lists[field]
+            value = record.get(field)
+            matches = index.matches(str(value)) if index is not None else []
+            values = {option_value for option_value, _ in matches}
+            if len(values) == 1:
+                continue
+            record_problems.append({
+                "campo": FORM_FIELDS[field],
+                "valor": value,
+                "problema": "ambiguo" if matches else "sin coincidencia",
+                "candidatos": [text for _, text in matches[:10]],
+            })
+        if record_problems:
+            problems.append({"posicion": position + 1, "registro": record, "problemas": record_problems})
+        else:
+            clean.append(record)
+    return clean, problems
+
+
+def prevalidate_records(records, load_option_lists, output_dir="output"):
+    """
+    Valida todos los registros antes de enviarlos y guarda un reporte con los
+    valores sin coincidencia o ambiguos
+    
+    Args:
+        records (list): Registros
+        load_option_lists (callable): Recibe las fechas y devuelve las listas de
+            opciones (ver validate_records)
+        output_dir (str): Carpeta del reporte
+        
+    Returns:
+        list: Registros que se pueden enviar
+    """
+    if not records:
+        return records
+    fechas = sorted({record.get("fecha") for record in records})
+    clean, problems = validate_records(records, load_option_lists(fechas))
+    print(f"Validación previa: {len(clean)} registros válidos, {len(problems)} con problemas")
+    if problems:
+        os.makedirs(output_dir, exist_ok=True)
+        report_path = os.path.join(output_dir, f"validacion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(problems, f, ensure_ascii=False, indent=2)
+        print(f"Reporte de validación guardado en: {report_path}")
+    return clean
+
+
+def is_record(item):
+    """True si `item` tiene la forma de un registro del extractor"""
+    return isinstance(item, dict) and all(field in item for field in ("fecha", "OP", "operario", "actividad"))
+
+
+class RecordWatcher:
+    def __init__(self, path, queue_size=100, poll_interval=2.0, from_start=False):
+        """
+        Vigila la salida del extractor y pone los registros nuevos en una cola acotada
+        
+        Args:
+            path (str): Directorio con los JSON del extractor (ej: "output") o un
+                archivo JSONL al que se agregan registros
+            queue_size (int): Registros máximos en espera; si la cola se llena,
+                la lectura se detiene hasta que el registro avance
+            poll_interval (float): Segundos entre revisiones
+            from_start (bool): Procesar también lo que ya existía al iniciar
+        """
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = {}
+        self._offset = 0
+        self._partial = ""
+        # Apariciones por clave dentro del JSONL vigilado (ver number_repeats)
+        self._jsonl_repeats = {}
+
+    def start(self):
+        if not self.from_start:
+            # Lo que ya existe se considera procesado
+            if os.path.isdir(self.path):
+                self._seen = {file_path: self._signature(file_path) for file_path in self._json_files()}
+            elif os.path.exists(self.path):
+                # Las líneas existentes cuentan para numerar las repeticiones que lleguen después
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    existing = f.read()
+                self._offset = len(existing.encode('utf-8'))
+                number_repeats(self._parse_lines(existing.splitlines()), self._jsonl_repeats)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print(f"Vigilando {self.path} (cola de {self.queue.maxsize} registros)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+
+    def get(self, timeout=None):
+        """Siguiente registro, o None si no llegó ninguno en `timeout` segundos"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _put(self, record):
+        while not self._stop.is_set():
+            try:
+                self.queue.put(record, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _json_files(self):
+        return sorted(
+            os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".json")
+        )
+
+    @staticmethod
+    def _signature(file_path):
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime
+
+    def _scan_directory(self):
+        for file_path in self._json_files():
+            try:
+                signature = self._signature(file_path)
+            except FileNotFoundError:
+                continue
+            if self._seen.get(file_path) == signature:
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # Archivo aún en escritura: se reintenta en la siguiente revisión
+                continue
+            self._seen[file_path] = signature
+            # Repeticiones numeradas dentro de cada archivo: un JSON nuevo que repite los
+            # registros de otro (libro re-extraído) produce las mismas claves del libro de envíos
+            records = number_repeats([item for item in data if is_record(item)] if isinstance(data, list) else [])
+            if records:
+                print(f"Nuevo archivo: {os.path.basename(file_path)} ({len(records)} registros)")
+            for record in records:
+                if not self._put(record):
+                    return
+
+    def _scan_jsonl(self):
+        if not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) < self._offset:
+            # El archivo se truncó o se reemplazó: empezar de nuevo
+            self._offset, self._partial, self._jsonl_repeats = 0, "", {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+            self._offset = f.tell()
+        lines = (self._partial + chunk).split("\n")
+        # La última línea puede estar incompleta
+        self._partial = lines.pop()
+        for record in number_repeats(self._parse_lines(lines, verbose=True), self._jsonl_repeats):
+            if not self._put(record):
+                return
+
+    def _parse_lines(self, lines, verbose=False):
+        """Registros de las líneas completas de un JSONL (cada línea, un registro o una lista)"""
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                if verbose:
+                    print(f"Línea no válida en {self.path}: {line[:80]}")
+                continue
+            records.extend(record for record in (item if isinstance(item, list) else [item]) if is_record(record))
+        return records
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if os.path.isdir(self.path):
+                    self._scan_directory()
+                else:
+                    self._scan_jsonl()
+            except Exception as e:
+                print(f"Error al leer {self.path}: {e}")
+            self._stop.wait(self.poll_interval)
+
+
+def partition_records(records, workers, key="fecha"):
+    """
+    Reparte los registros entre sesiones sin separar los que comparten la clave,
+    para que dos sesiones nunca trabajen la misma fecha (u operario) a la vez
+    
+    Args:
+        records (list): Registros
+        workers (int): Número de sesiones
+        key (str): Campo del registro que no se puede repartir ("fecha" u "operario")
+        
+    Returns:
+        list: Una lista de pares (posición original, registro) por sesión
+    """
+    groups = {}
+    for position, record in enumerate(records):
+        groups.setdefault(record.get(key), []).append((position, record))
+
+    # Grupos más grandes primero, cada uno a la sesión con menos carga
+    partitions = [[] for _ in range(max(1, workers))]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(partitions, key=len).extend(group)
+    return [partition for partition in partitions if partition]
+
+
+class ProgressCollector:
+    def __init__(self, total):
+        """
+        Resultados y avance compartidos entre sesiones de registro
+        
+        Args:
+            total (int): Número de registros a procesar
+        """
+        self.total = total
+        self.results = [None] * total
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, position, result, worker=None):
+        """Guarda el resultado de un registro e imprime el avance"""
+        with self._lock:
+            self.results[position] = result
+            self.done += 1
+            if not result["ok"]:
+                self.failed += 1
+            prefix = f"[sesión {worker}] " if worker is not None else ""
+            status = "OK" if result["ok"] else f"Error: {result['error']}"
+            print(f"{prefix}Registro {self.done}/{self.total} ({position + 1}): {status}")
+
+    def report(self):
+        """Imprime el resumen de la ejecución"""
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed * 60 if elapsed else 0
+        print(
+            f"\nRegistrados {self.done - self.failed}/{self.total} "
+            f"({self.failed} con error) en {elapsed:.1f}s, {rate:.1f} registros/min"
+        )
+
+
+class WaitStats:
+    def __init__(self):
+        """Acumula el tiempo de espera por condición"""
+        self._stats = {}
+
+    def record(self, condition, seconds, timed_out=False):
+        """Registra una espera"""
+        entry = self._stats.setdefault(
+            condition, {"esperas": 0, "total": 0.0, "maximo": 0.0, "agotadas": 0}
+        )
+        entry["esperas"] += 1
+        entry["total"] += seconds
+        entry["maximo"] = max(entry["maximo"], seconds)
+        if timed_out:
+            entry["agotadas"] += 1
+
+    def report(self):
+        """Devuelve e imprime el reporte de esperas por condición"""
+        print("\nTiempo de espera por condición:")
+        print(f"  {'condición':<22}{'esperas':>8}{'total s':>10}{'media s':>10}{'máx s':>8}{'agotadas':>10}")
+        for condition, entry in sorted(self._stats.items(), key=lambda item: -item[1]["total"]):
+            media = entry["total"] / entry["esperas"]
+            print(f"  {condition:<22}{entry['esperas']:>8}{entry['total']:>10.2f}"
+                  f"{media:>10.2f}{entry['maximo']:>8.2f}{entry['agotadas']:>10}")
+        return {condition: dict(entry) for condition, entry in self._stats.items()}
+
+
 class FormAutomation:
     # Selector del botón "Adicionar Operario" (ajusta según tu HTML)
     ADD_OPERATOR_BUTTON_SELECTOR = "/html/body/tu_ruta_al_boton_add_operario"
     ADD_OPERATOR_BUTTON_SELECTOR_TYPE = "xpath"
 
-    def __init__(self):
-        """Inicializa el driver de Chrome"""
+    ADICIONAR_XPATH = "/html/body/div[3]/table/tbody/tr[17]/td/div/input"
+    NUEVO_REGISTRO_XPATH = "/html/body/div[3]/table/tbody/tr[3]/td[1]/button"
+    REPORTES_XPATH = "/html/body/aside/div/ul/li[8]/a"
+
+    def __init__(self, timeouts=None, fill_engine="teclado", headless=False, fast=False,
+                 driver_path=None, profile_dir=None):
+        """
+        Inicializa el driver de Chrome
+        
+        Args:
+            timeouts (dict): Tiempos máximos por condición (ver DEFAULT_TIMEOUTS)
+            fill_engine (str): "teclado" (send_keys campo por campo) o "script"
+                (todo el formulario en una sola llamada, con el teclado como respaldo)
+            headless (bool): Ejecutar Chrome sin ventana
+            fast (bool): Modo rápido: carga "eager" y sin imágenes, fuentes ni CSS
+            driver_path (str): chromedriver a usar (None = el de la caché o webdriver-manager)
+            profile_dir (str): Perfil persistente de Chrome; si la sesión del SCP
+                sigue activa, el login se omite
+        """
         chrome_options = webdriver.ChromeOptions()
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
-        # chrome_options.add_argument("--headless")  # Descomenta para modo headless
+        if headless:
+            chrome_options.add_argument("--headless=new")
+        if profile_dir:
+            chrome_options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+        if fast:
+            # No esperar imágenes ni hojas de estilo para devolver el control
+            chrome_options.page_load_strategy = "eager"
+            chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+            chrome_options.add_argument("--disable-extensions")
+            chrome_options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2}
+            )
+
+        try:
+            self.driver = webdriver.Chrome(service=Service(resolve_driver_path(driver_path)), options=chrome_options)
+        except SessionNotCreatedException:
+            if driver_path:
+                raise
+            # Chrome se actualizó y el chromedriver guardado ya no es compatible
+            print("chromedriver guardado incompatible con Chrome, resolviendo uno nuevo")
+            self.driver = webdriver.Chrome(service=Service(resolve_driver_path(refresh=True)),
+                                           options=chrome_options)
+        if fast:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_RESOURCES})
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.wait = WebDriverWait(self.driver, self.timeouts["elemento"])
+        self.wait_stats = WaitStats()
+        self.fill_engine = fill_engine
+        self._last_fecha = None
+        # Índices de opciones por select; se reconstruyen cuando su contenido cambia
+        self._option_indexes = {}
+        # Margen sobre la espera de recarga de OPs dentro del script
+        self.driver.set_script_timeout(self.timeouts["recarga_ops"] + self.timeouts["elemento"])
+
+    def _wait_for(self, condition_name, condition, timeout_key="elemento"):
+        """
+        Espera una condición del DOM registrando cuánto tardó
+        
+        Args:
+            condition_name (str): Nombre de la condición para el reporte
+            condition (callable): Condición de WebDriverWait
+            timeout_key (str): Clave de self.timeouts
+            
+        Returns:
+            Resultado de la condición
+        """
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(self.driver, self.timeouts[timeout_key], poll_frequency=0.1).until(condition)
+        except TimeoutException:
+            self.wait_stats.record(condition_name, time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(condition_name, time.perf_counter() - start)
+        return result
 
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.wait = WebDriverWait(self.driver, 10)
+    def _options_signature(self, select_name):
+        """Valores de las opciones de un select en una sola llamada"""
+        return self.driver.execute_script(OPTIONS_SIGNATURE_SCRIPT, select_name)
 
-    def _select_by_partial_text(self, select_elem: Select, partial_text: str):
+    def _wait_for_op_reload(self, previous_signature):
         """
-        Dado un objeto Select y una subcadena, selecciona la primera opción
-        cuyo texto contenga esa subcadena (case-insensitive).
+        Espera a que cboOPF se recargue después de cambiar la fecha: sus opciones
+        cambian, o bien la petición AJAX que la recarga empieza y termina
         """
-        for option in select_elem.options:
-            if partial_text.strip().lower() in option.text.strip().lower():
-                select_elem.select_by_visible_text(option.text)
-                return
-        raise ValueError(f"No se encontró ninguna opción que contenga '{partial_text}'")
+        ajax_seen = {"value": False}
+
+        def reloaded(driver):
+            signature, pending = driver.execute_script(OP_RELOAD_STATE_SCRIPT)
+            if signature and signature != previous_signature:
+                return True
+            if pending > 0:
+                ajax_seen["value"] = True
+                return False
+            return ajax_seen["value"] and pending == 0 and bool(signature)
+
+        try:
+            self._wait_for("recarga_ops", reloaded, "recarga_ops")
+        except TimeoutException:
+            # Misma lista de OPs para la nueva fecha: se continúa con las opciones actuales
+            pass
+
+    def _wait_for_submission(self, actividad_elem, rows_before):
+        """
+        Espera la respuesta a "Adicionar": nueva fila en la tabla, formulario
+        recargado/limpio o una alerta. La alerta se lee y se acepta para que no
+        bloquee la página
+        
+        Returns:
+            str: Texto de la alerta, o None si la tabla o el formulario confirmaron el envío
+        """
+        alert_text = {"value": None}
+
+        def submitted(driver):
+            alert = EC.alert_is_present()(driver)
+            if alert:
+                alert_text["value"] = alert.text
+                alert.accept()
+                return True
+            try:
+                if actividad_elem.get_attribute("value") == "":
+                    return True
+            except Exception:
+                # El campo ya no existe: la página se recargó
+                return True
+            return driver.execute_script(ROW_COUNT_SCRIPT) != rows_before
+
+        self._wait_for("confirmacion_envio", submitted, "envio")
+        return alert_text["value"]
+
+    def _option_index(self, select_elem: Select, name=None, refresh=False):
+        """
+        Índice de opciones de un select, leído en una sola llamada y reutilizado
+        mientras el elemento no cambie ni se invalide (ej: cboOPF al cambiar la fecha)
+        """
+        element = select_elem._el
+        key = name or element.id
+        cached = self._option_indexes.get(key)
+        if refresh or cached is None or cached[0] != element.id:
+            options = self.driver.execute_script(OPTIONS_SCRIPT, element)
+            cached = (element.id, OptionIndex(options))
+            self._option_indexes[key] = cached
+        return cached[1]
+
+    def _invalidate_options(self, name):
+        """Descarta el índice de opciones de un select"""
+        self._option_indexes.pop(name, None)
+
+    def _select_by_partial_text(self, select_elem: Select, partial_text: str, name=None):
+        """
+        Dado un objeto Select y una subcadena, selecciona la opción que coincide
+        (texto exacto, prefijo o subcadena; sin distinguir mayúsculas) usando el
+        índice en memoria, sin leer las opciones una por una del navegador.
+        """
+        index = self._option_index(select_elem, name)
+        match = index.lookup(partial_text)
+        if match is None:
+            # El select pudo recargarse sin que se detectara: releer una vez
+            index = self._option_index(select_elem, name, refresh=True)
+            match = index.lookup(partial_text)
+        if match is None:
+            raise ValueError(f"No se encontró ninguna opción que contenga '{partial_text}'")
+
+        try:
+            select_elem.select_by_value(match[0])
+        except NoSuchElementException:
+            index = self._option_index(select_elem, name, refresh=True)
+            match = index.lookup(partial_text)
+            if match is None:
+                raise ValueError(f"No se encontró ninguna opción que contenga '{partial_text}'")
+            select_elem.select_by_value(match[0])
+
+    def _enter_credentials(self, username, password):
+        """Llena usuario y contraseña y hace clic en el botón de login"""
+        # 1) Ingreso de usuario y contraseña
+        username_field = self.wait.until(
+            EC.presence_of_element_located((By.NAME, "txtUsuario"))
+        )
+        password_field = self.wait.until(
+            EC.presence_of_element_located((By.NAME, "txtPass"))
+        )
+
+        username_field.clear()
+        username_field.send_keys(username)
+        password_field.clear()
+        password_field.send_keys(password)
+
+        # 2) Clic en el botón de login
+        login_button = self.wait.until(
+            EC.element_to_be_clickable((By.XPATH, "/html/body/form/div[4]/button"))
+        )
+        login_button.click()
 
     def login(self, url, username, password):
-        """Realiza el login en el sitio web"""
+        """
+        Realiza el login en el sitio web
+        
+        Returns:
+            bool: True si se llegó al formulario de registro
+        """
         try:
             print(f"Navegando a: {url}")
             self.driver.get(url)
-            time.sleep(2)
-
-            # 1) Ingreso de usuario y contraseña
-            username_field = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "txtUsuario"))
-            )
-            password_field = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "txtPass"))
-            )
-
-            username_field.clear()
-            username_field.send_keys(username)
-            password_field.clear()
-            password_field.send_keys(password)
 
-            # 2) Clic en el botón de login
-            login_button = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, "/html/body/form/div[4]/button"))
+            # Con un perfil persistente la sesión puede seguir activa: sin formulario de login
+            start_page = self._wait_for(
+                "pagina_inicio",
+                lambda driver: driver.find_elements(By.NAME, "txtUsuario")
+                or driver.find_elements(By.XPATH, self.REPORTES_XPATH),
             )
-            login_button.click()
-
-            print("Login realizado exitosamente")
+            if start_page[0].get_attribute("name") != "txtUsuario":
+                print("Sesión activa, se omite el login")
+            else:
+                self._enter_credentials(username, password)
+                print("Login realizado exitosamente")
 
             # 3) Espera por el botón de reportes y clic en él
             report_button = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, "/html/body/aside/div/ul/li[8]/a"))
+                EC.element_to_be_clickable((By.XPATH, self.REPORTES_XPATH))
             )
             report_button.click()
 
@@ -90,85 +1127,140 @@ class FormAutomation:
             report_button.click()
 
             print("Fechas ingresadas exitosamente")
+            return True
 
         except TimeoutException:
             print("Error: Tiempo de espera agotado al buscar elementos de login")
         except NoSuchElementException as e:
             print(f"Error: No se encontró el elemento: {e}")
+        return False
 
     def load_json_data(self, json_file_path):
         """Carga los datos desde el archivo JSON"""
-        try:
-            with open(json_file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            print(f"Datos cargados exitosamente: {len(data)} registros")
-            return data
-        except FileNotFoundError:
-            print(f"Error: No se encontró el archivo {json_file_path}")
-            return []
-        except json.JSONDecodeError:
-            print("Error: El archivo JSON no tiene formato válido")
-            return []
+        return load_json_records(json_file_path)
 
     def fill_form(self, record):
-        """Llena el formulario con un registro de datos"""
+        """
+        Llena el formulario con un registro de datos
+        
+        Returns:
+            bool: True si todos los campos se llenaron
+        """
+        if self.fill_engine == "script":
+            report = self.fill_form_script(record)
+            failed = {field: result for field, result in report.items() if not result.get("ok")}
+            if not failed:
+                return True
+            print(f"Llenado por script incompleto ({', '.join(failed)}), usando teclado")
+        return self.fill_form_keys(record)
+
+    def fill_form_script(self, record):
+        """
+        Llena todos los campos en una sola llamada de script
+        
+        Returns:
+            dict: Reporte por campo {"campo": {"ok": bool, "error"/"opcion": str}}
+        """
+        fecha_changed = record["fecha"] != self._last_fecha
+        start = time.perf_counter()
         try:
-            # 1) Campo fecha
-            fecha_field = self.wait.until(
-                EC.element_to_be_clickable((By.NAME, "fecha"))
+            self._wait_for("campo_fecha", EC.element_to_be_clickable((By.NAME, "fecha")))
+            report = self.driver.execute_async_script(
+                FILL_FORM_SCRIPT, record, fecha_changed, int(self.timeouts["recarga_ops"] * 1000)
             )
-            fecha_field.clear()
-            fecha_field.send_keys(record["fecha"])
-            time.sleep(0.5)
-            fecha_field.send_keys(Keys.TAB)
+        except Exception as e:
+            return {"script": {"ok": False, "error": str(e)}}
+        finally:
+            self.wait_stats.record("llenado_script", time.perf_counter() - start)
+
+        if report.get("fecha", {}).get("ok"):
+            if fecha_changed:
+                self._invalidate_options("cboOPF")
+            self._last_fecha = record["fecha"]
+        return report
+
+    def _enter_fecha(self, fecha):
+        """Escribe la fecha y, si cambió, espera la recarga de cboOPF"""
+        fecha_field = self._wait_for("campo_fecha", EC.element_to_be_clickable((By.NAME, "fecha")))
+        fecha_changed = fecha != self._last_fecha
+        previous_ops = self._options_signature("cboOPF") if fecha_changed else None
+        fecha_field.clear()
+        fecha_field.send_keys(fecha)
+        fecha_field.send_keys(Keys.TAB)
+        if fecha_changed:
+            self._wait_for_op_reload(previous_ops)
+            self._invalidate_options("cboOPF")
+            self._last_fecha = fecha
+
+    def load_option_lists(self, fechas):
+        """
+        Lee las opciones de los selects: cboOperario y cboEquipo una vez y cboOPF por fecha
+        
+        Returns:
+            dict: {"OP": {fecha: OptionIndex}, "operario": OptionIndex, "equipo": OptionIndex}
+        """
+        option_lists = {"OP": {}}
+        for field in ("operario", "equipo"):
+            elem = self._wait_for(f"select_{field}", EC.presence_of_element_located((By.NAME, FORM_FIELDS[field])))
+            option_lists[field] = self._option_index(Select(elem), FORM_FIELDS[field])
+        for fecha in fechas:
+            self._enter_fecha(fecha)
+            elem = self._wait_for("select_op", EC.presence_of_element_located((By.NAME, "cboOPF")))
+            option_lists["OP"][fecha] = self._option_index(Select(elem), "cboOPF")
+        return option_lists
+
+    def fill_form_keys(self, record):
+        """
+        Llena el formulario campo por campo simulando el teclado
+        
+        Returns:
+            bool: True si todos los campos se llenaron
+        """
+        try:
+            # 1) Campo fecha
+            self._enter_fecha(record["fecha"])
 
             # 2) Campo OP (Select) con búsqueda parcial
-            op_elem = self.wait.until(EC.element_to_be_clickable((By.NAME, "cboOPF")))
+            op_elem = self._wait_for("select_op", EC.element_to_be_clickable((By.NAME, "cboOPF")))
             op_select = Select(op_elem)
-            self._select_by_partial_text(op_select, str(record["OP"]))
-            time.sleep(0.5)
+            self._select_by_partial_text(op_select, str(record["OP"]), "cboOPF")
 
             # 3) Campo operario (Select) con búsqueda parcial
-            oper_elem = self.wait.until(EC.element_to_be_clickable((By.NAME, "cboOperario")))
+            oper_elem = self._wait_for("select_operario", EC.element_to_be_clickable((By.NAME, "cboOperario")))
             oper_select = Select(oper_elem)
-            self._select_by_partial_text(oper_select, record["operario"])
-            time.sleep(0.5)
+            self._select_by_partial_text(oper_select, record["operario"], "cboOperario")
 
             # 4) Campo actividad
-            actividad_field = self.wait.until(
-                EC.element_to_be_clickable((By.NAME, "txtActividad"))
-            )
+            actividad_field = self._wait_for("campo_actividad", EC.element_to_be_clickable((By.NAME, "txtActividad")))
             actividad_field.clear()
             actividad_field.send_keys(record["actividad"])
-            time.sleep(0.5)
 
             # 5) Campo tiempo ordinario
-            tiempo_ord_field = self.wait.until(
-                EC.element_to_be_clickable((By.NAME, "txtTiempoOrdinario"))
+            tiempo_ord_field = self._wait_for(
+                "campo_tiempo_ordinario", EC.element_to_be_clickable((By.NAME, "txtTiempoOrdinario"))
             )
             tiempo_ord_field.clear()
             tiempo_ord_field.send_keys(record["tiempo_ordinario"])
-            time.sleep(0.5)
 
             # 6) Campo tiempo extra (opcional)
             if record.get("tiempo_extra"):
-                tiempo_extra_field = self.wait.until(
-                    EC.element_to_be_clickable((By.NAME, "txtTiempoExtra"))
+                tiempo_extra_field = self._wait_for(
+                    "campo_tiempo_extra", EC.element_to_be_clickable((By.NAME, "txtTiempoExtra"))
                 )
                 tiempo_extra_field.clear()
                 tiempo_extra_field.send_keys(record["tiempo_extra"])
-                time.sleep(0.5)
 
             # 7) Campo equipo (Select) con búsqueda parcial
-            equipo_elem = self.wait.until(EC.element_to_be_clickable((By.NAME, "cboEquipo")))
+            equipo_elem = self._wait_for("select_equipo", EC.element_to_be_clickable((By.NAME, "cboEquipo")))
             equipo_select = Select(equipo_elem)
-            self._select_by_partial_text(equipo_select, record["equipo"])
-            time.sleep(0.5)
+            self._select_by_partial_text(equipo_select, record["equipo"], "cboEquipo")
+            return True
 
         except NoSuchElementException as e:
             print(f"Error: No se encontró el campo en el formulario: {e}")
         except Exception as e:
             print(f"Error al llenar el formulario: {e}")
+        return False
 
     def click_button(self, button_selector, selector_type="xpath"):
         """Hace click en un botón específico"""
@@ -188,40 +1280,171 @@ class FormAutomation:
 
             button.click()
             print(f"Click realizado en: {button_selector}")
-            time.sleep(1)
 
         except TimeoutException:
             print(f"Error: No se pudo hacer click en {button_selector}")
+            raise
         except Exception as e:
             print(f"Error al hacer click: {e}")
+            raise
 
-    def process_all_records(self, json_file_path, submit_each=True):
-        """Procesa todos los registros del archivo JSON"""
-        data = self.load_json_data(json_file_path)
-        if not data:
-            return
-
-        for i, record in enumerate(data, 1):
-            print(f"\nProcesando registro {i}/{len(data)}")
-            self.fill_form(record)
+    def register_record(self, record, on_submit=None):
+        """
+        Llena y envía un registro, y deja el formulario listo para el siguiente
+        
+        Args:
+            record (dict): Registro
+            on_submit (callable): Se llama justo antes de hacer clic en "Adicionar"
+            
+        Returns:
+            dict: {"ok": bool, "confirmado": bool, "registro": dict, "error": str, "segundos": float}
+        """
+        start = time.perf_counter()
+        result = {"ok": False, "registro": record, "error": None}
+        try:
+            if not self.fill_form(record):
+                # No se envía un formulario incompleto
+                result["error"] = "no se pudo llenar el formulario"
+                return result
 
-            # Solicitar permiso para adicionar operario
-            # print("Formulario completado. Presiona ENTER para adicionar operario y continuar...")
-            # input()
+            actividad_elem = self.driver.find_element(By.NAME, "txtActividad")
+            rows_before = self.driver.execute_script(ROW_COUNT_SCRIPT)
+            if on_submit is not None:
+                on_submit(record)
+            self.click_button(self.ADICIONAR_XPATH, "xpath")
+            result["confirmado"] = True
+            try:
+                alert_text = self._wait_for_submission(actividad_elem, rows_before)
+            except TimeoutException:
+                alert_text = None
+                result["confirmado"] = False
+                print("Advertencia: no se detectó confirmación del envío")
+            verdict = classify_alert(alert_text) if alert_text is not None else True
+            if verdict is False:
+                # El formulario sigue con los datos rechazados; el siguiente registro lo sobrescribe
+                result["confirmado"] = False
+                result["error"] = f"el SCP rechazó el registro: {alert_text}"
+                print(f"Error: {result['error']}")
+                return result
+            result["ok"] = True
+            if verdict is None:
+                # Quizá se guardó: queda sin confirmar en lugar de reenviarse en la próxima ejecución
+                result["confirmado"] = False
+                result["error"] = f"alerta no reconocida: {alert_text}"
+                print(f"Advertencia: {result['error']}")
+            else:
+                print("Añadido con éxito")
 
-            # if submit_each:
-            self.click_button("/html/body/div[3]/table/tbody/tr[17]/td/div/input", "xpath")
-            time.sleep(2)
             # Esperar a que el siguiente botón esté disponible y hacer clic en él
-            print("Añadido con éxito")
-            report_button = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, "/html/body/div[3]/table/tbody/tr[3]/td[1]/button"))
+            report_button = self._wait_for(
+                "boton_nuevo_registro", EC.element_to_be_clickable((By.XPATH, self.NUEVO_REGISTRO_XPATH))
             )
             report_button.click()
-
-            # Imprimir mensaje de éxito
             print("Continuando con nuevo registro de operario")
-                
+        except Exception as e:
+            result["error"] = result["error"] or str(e)
+        finally:
+            result["segundos"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def process_records(self, records, progress=None, worker=None, ledger=None):
+        """
+        Registra una lista de registros en esta sesión
+        
+        Args:
+            records (list): Registros, o pares (posición, registro) si hay `progress`
+            progress (ProgressCollector): Colector compartido entre sesiones
+            worker (int): Número de sesión para los mensajes
+            ledger (SubmissionLedger): Libro donde se anota cada envío
+            
+        Returns:
+            list: Resultado de cada registro
+        """
+        results = []
+        for i, item in enumerate(records, 1):
+            position, record = item if progress is not None else (i - 1, item)
+            if progress is None:
+                print(f"\nProcesando registro {i}/{len(records)}")
+            result = self.register_record(record, ledger.mark_sending if ledger else None)
+            if ledger is not None:
+                ledger.record(result)
+            results.append(result)
+            if progress is not None:
+                progress.add(position, result, worker)
+        return results
+
+    def session_expired(self):
+        """True si el navegador volvió a la página de login"""
+        return bool(self.driver.find_elements(By.NAME, "txtUsuario"))
+
+    def watch_and_register(self, watcher, credentials, ledger=None, idle_report=300):
+        """
+        Registra los registros que van llegando al watcher con esta sesión ya
+        iniciada, hasta que se interrumpa con Ctrl+C
+        
+        Args:
+            watcher (RecordWatcher): Fuente de registros
+            credentials (tuple): (url, usuario, contraseña) para reabrir la sesión si expira
+            ledger (SubmissionLedger): Libro para no repetir registros ya confirmados
+            idle_report (float): Segundos sin registros entre mensajes de espera
+            
+        Returns:
+            dict: Registros enviados y fallidos
+        """
+        counts = {"enviados": 0, "fallidos": 0, "omitidos": 0}
+        watcher.start()
+        last_activity = time.perf_counter()
+        try:
+            while True:
+                record = watcher.get(timeout=1)
+                if record is None:
+                    if time.perf_counter() - last_activity > idle_report:
+                        print(f"En espera de registros nuevos... {counts}")
+                        last_activity = time.perf_counter()
+                    continue
+                last_activity = time.perf_counter()
+                if ledger is not None and not ledger.pending([record], verbose=False):
+                    counts["omitidos"] += 1
+                    continue
+
+                result = self.register_record(record, ledger.mark_sending if ledger else None)
+                if not result["ok"] and self.session_expired():
+                    print("Sesión expirada, iniciando sesión de nuevo")
+                    if self.login(*credentials):
+                        result = self.register_record(record, ledger.mark_sending if ledger else None)
+                if ledger is not None:
+                    ledger.record(result)
+                counts["enviados" if result["ok"] else "fallidos"] += 1
+                print(f"Registro {record['fecha']} OP {record['OP']}: {'OK' if result['ok'] else result['error']}")
+        except KeyboardInterrupt:
+            print("\nVigilancia detenida")
+        finally:
+            watcher.stop()
+            self.wait_stats.report()
+        print(f"Resumen: {counts}")
+        return counts
+
+    def process_all_records(self, json_file_path, submit_each=True, ledger=None, validate=False):
+        """
+        Procesa todos los registros del archivo JSON
+        
+        Args:
+            ledger (SubmissionLedger): Si se indica, solo se envían los registros
+                que no estén confirmados y se anota el resultado de cada uno
+            validate (bool): Descartar antes de enviar los registros cuyas OP,
+                operario o equipo no existen (o son ambiguos) en el formulario
+        """
+        data = self.load_json_data(json_file_path)
+        if ledger is not None:
+            data = ledger.pending(data)
+        if validate:
+            data = prevalidate_records(data, self.load_option_lists)
+        if not data:
+            return []
+
+        results = self.process_records(data, ledger=ledger)
+        self.wait_stats.report()
+        return results
 
     def close(self):
         """Cierra el navegador"""
@@ -229,22 +1452,382 @@ class FormAutomation:
         print("Navegador cerrado")
 
 
+class HttpFormSubmitter:
+    """
+    Motor de registro por HTTP: envía el formulario directamente al servidor
+    con una sesión persistente (keep-alive), sin navegador
+    """
+
+    def __init__(self, form_url=None, op_options_url=None, workers=4, timeout=10):
+        """
+        Args:
+            form_url (str): Página con el formulario de registro (campo txtActividad).
+                Si es None se usa la página a la que lleva el login.
+            op_options_url (str): Plantilla con {fecha} que devuelve las <option> de
+                cboOPF para una fecha. Si es None se usan las OP del formulario.
+            workers (int): Envíos simultáneos
+            timeout (float): Tiempo máximo por petición (segundos)
+        """
+        self.form_url = form_url
+        self.op_options_url = op_options_url
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.form = None
+        self.form_action = None
+        self.indexes = {}
+        self._op_indexes = {}
+        self._lock = threading.Lock()
+        self._landing_html = None
+        self._landing_url = None
+
+    @staticmethod
+    def _find_form(forms, field_name):
+        for form in forms:
+            if field_name in form["inputs"] or field_name in form["selects"]:
+                return form
+        return None
+
+    def login(self, url, username, password):
+        """
+        Inicia sesión con los campos txtUsuario/txtPass de render.php
+        
+        Returns:
+            bool: True si el servidor aceptó las credenciales
+        """
+        print(f"Navegando a: {url}")
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        form = self._find_form(FormPageParser.parse(response.text), "txtUsuario")
+        if form is None:
+            raise ValueError("No se encontró el formulario de login (txtUsuario)")
+
+        payload = dict(form["inputs"])
+        payload["txtUsuario"] = username
+        payload["txtPass"] = password
+        submit_name = next((name for name, _ in form["submits"] if name), None)
+        if submit_name:
+            payload[submit_name] = dict(form["submits"])[submit_name]
+
+        action = urljoin(response.url, form["action"] or response.url)
+        response = self.session.post(action, data=payload, timeout=self.timeout)
+        response.raise_for_status()
+        if self._find_form(FormPageParser.parse(response.text), "txtPass") is not None:
+            print("Error: el servidor rechazó las credenciales")
+            return False
+
+        self._landing_html = response.text
+        self._landing_url = response.url
+        print("Login realizado exitosamente")
+        return True
+
+    def load_form(self):
+        """Descarga el formulario de registro e indexa las opciones de sus selects"""
+        if self.form_url:
+            response = self.session.get(self.form_url, timeout=self.timeout)
+            response.raise_for_status()
+            html, page_url = response.text, response.url
+        else:
+            html, page_url = self._landing_html or "", self._landing_url
+        form = self._find_form(FormPageParser.parse(html), FORM_FIELDS["actividad"])
+        if form is None:
+            raise ValueError("No se encontró el formulario de registro (txtActividad); configure form_url")
+
+        self.form = form
+        self.form_action = urljoin(page_url, form["action"] or page_url)
+        self.indexes = {
+            field: OptionIndex(form["selects"].get(FORM_FIELDS[field], []))
+            for field in SELECT_FIELDS
+        }
+        print(
+            "Formulario cargado: "
+            + ", ".join(f"{field}={len(index.options)} opciones" for field, index in self.indexes.items())
+        )
+
+    def op_index(self, fecha):
+        """Índice de OP disponibles para una fecha (una petición por fecha)"""
+        if not self.op_options_url:
+            return self.indexes["OP"]
+        with self._lock:
+            index = self._op_indexes.get(fecha)
+        if index is None:
+            response = self.session.get(self.op_options_url.format(fecha=fecha), timeout=self.timeout)
+            response.raise_for_status()
+            index = OptionIndex(parse_options_html(response.text))
+            with self._lock:
+                self._op_indexes[fecha] = index
+        return index
+
+    def load_option_lists(self, fechas):
+        """Opciones de los selects (ver FormAutomation.load_option_lists)"""
+        if self.form is None:
+            self.load_form()
+        return {
+            "OP": {fecha: self.op_index(fecha) for fecha in fechas},
+            "operario": self.indexes["operario"],
+            "equipo": self.indexes["equipo"],
+        }
+
+    def build_payload(self, record):
+        """
+        Campos del POST para un registro, resolviendo los valores de los selects
+        
+        Returns:
+            dict: Datos del formulario
+        """
+        payload = dict(self.form["inputs"])
+        for field, form_name in FORM_FIELDS.items():
+            if field in SELECT_FIELDS:
+                index = self.op_index(record["fecha"]) if field == "OP" else self.indexes[field]
+                match = index.lookup(str(record[field]))
+                if match is None:
+                    raise ValueError(f"No se encontró ninguna opción de {form_name} que contenga '{record[field]}'")
+                payload[form_name] = match[0]
+            else:
+                payload[form_name] = record.get(field) or ""
+
+        submit = next(
+            ((name, value) for name, value in self.form["submits"] if name and "adicionar" in value.lower()),
+            next(((name, value) for name, value in self.form["submits"] if name), None),
+        )
+        if submit:
+            payload[submit[0]] = submit[1]
+        return payload
+
+    def submit(self, record, on_submit=None):
+        """
+        Envía un registro
+        
+        Args:
+            record (dict): Registro
+            on_submit (callable): Se llama justo antes del POST
+            
+        Returns:
+            dict: {"ok": bool, "confirmado": bool, "registro": dict, "error": str, "segundos": float}
+        """
+        start = time.perf_counter()
+        result = {"ok": False, "registro": record, "error": None}
+        try:
+            payload = self.build_payload(record)
+            if on_submit is not None:
+                on_submit(record)
+            response = self.session.post(self.form_action, data=payload, timeout=self.timeout)
+            if self._find_form(FormPageParser.parse(response.text), "txtPass") is not None:
+                result["error"] = "sesión expirada"
+            else:
+                result["ok"], result["confirmado"], result["error"] = parse_submission_response(response)
+        except Exception as e:
+            result["error"] = str(e)
+        result["segundos"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def submit_records(self, records, ledger=None):
+        """
+        Envía los registros con `workers` peticiones simultáneas
+        
+        Args:
+            records (list): Registros
+            ledger (SubmissionLedger): Libro donde se anota cada envío
+            
+        Returns:
+            list: Resultados en el orden de los registros
+        """
+        if self.form is None:
+            self.load_form()
+
+        def submit(record):
+            result = self.submit(record, ledger.mark_sending if ledger else None)
+            if ledger is not None:
+                ledger.record(result)
+            return result
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(submit, records))
+
+        for i, result in enumerate(results, 1):
+            if not result["ok"]:
+                print(f"Error en registro {i}/{len(results)}: {result['error']}")
+        elapsed = time.perf_counter() - start
+        ok = sum(result["ok"] for result in results)
+        print(f"\nEnviados {ok}/{len(results)} registros en {elapsed:.1f}s")
+        return results
+
+    def process_all_records(self, json_file_path, ledger=None, validate=False):
+        """Procesa todos los registros del archivo JSON (ver FormAutomation.process_all_records)"""
+        data = load_json_records(json_file_path)
+        if ledger is not None:
+            data = ledger.pending(data)
+        if validate:
+            data = prevalidate_records(data, self.load_option_lists)
+        if not data:
+            return []
+        return self.submit_records(data, ledger)
+
+    def close(self):
+        """Cierra la sesión HTTP"""
+        self.session.close()
+        print("Sesión HTTP cerrada")
+
+
+def run_parallel_sessions(records, url, username, password, sessions=4, key="fecha",
+                          timeouts=None, fill_engine="teclado", ledger=None, validate=False,
+                          browser_options=None):
+    """
+    Registra los datos con varias sesiones de Chrome sin ventana, cada una con su
+    propio login y un grupo de registros que no comparte `key` con las demás
+    
+    Args:
+        records (list): Registros en el formato del extractor
+        url, username, password (str): Datos de acceso
+        sessions (int): Número de navegadores simultáneos
+        key (str): "fecha" u "operario"
+        timeouts (dict): Tiempos máximos por condición
+        fill_engine (str): "teclado" o "script"
+        ledger (SubmissionLedger): Si se indica, solo se envían los registros pendientes
+        validate (bool): Validar antes las opciones de los selects con una sesión aparte
+        browser_options (dict): fast, driver_path y profile_dir de FormAutomation;
+            cada sesión usa su propio perfil (profile_dir_1, profile_dir_2, ...)
+        
+    Returns:
+        list: Resultado de cada registro enviado en el orden original
+    """
+    if ledger is not None:
+        records = ledger.pending(records)
+    browser_options = dict(browser_options or {})
+    profile_dir = browser_options.pop("profile_dir", None)
+
+    def session_options(worker):
+        # Chrome no permite que dos procesos compartan un perfil
+        options = dict(browser_options, headless=True)
+        if profile_dir:
+            options["profile_dir"] = f"{profile_dir}_{worker}"
+        return options
+
+    if validate and records:
+        automation = FormAutomation(timeouts=timeouts, **session_options("validacion"))
+        try:
+            if not automation.login(url, username, password):
+                raise RuntimeError("login fallido en la sesión de validación")
+            records = prevalidate_records(records, automation.load_option_lists)
+        finally:
+            automation.close()
+    partitions = partition_records(records, sessions, key)
+    progress = ProgressCollector(len(records))
+    print(f"Registrando {len(records)} registros con {len(partitions)} sesiones (agrupados por {key})")
+
+    def run_worker(worker, partition):
+        automation = None
+        try:
+            automation = FormAutomation(timeouts=timeouts, fill_engine=fill_engine, **session_options(worker))
+            if not automation.login(url, username, password):
+                raise RuntimeError("login fallido")
+            automation.process_records(partition, progress, worker, ledger)
+        except Exception as e:
+            print(f"[sesión {worker}] Error: {e}")
+            # Los registros que la sesión no alcanzó a procesar se marcan como fallidos
+            for position, record in partition:
+                if progress.results[position] is None:
+                    result = {"ok": False, "registro": record, "error": str(e)}
+                    progress.add(position, result, worker)
+                    if ledger is not None:
+                        ledger.record(result)
+        finally:
+            if automation is not None:
+                automation.close()
+
+    with ThreadPoolExecutor(max_workers=len(partitions) or 1) as executor:
+        for future in [executor.submit(run_worker, n, part) for n, part in enumerate(partitions, 1)]:
+            future.result()
+
+    progress.report()
+    return progress.results
+
+
 def main():
     URL = "http://192.168.1.85:8181/scp/render.php?frm=acceso.logIn"
     USERNAME = "admin"
     PASSWORD = "123"
     JSON_FILE = "output/nelson_rangel_20250528_164058.json"
+    # Tiempos máximos de espera por condición (segundos)
+    TIMEOUTS = {"elemento": 10, "recarga_ops": 5, "envio": 10}
+    # "teclado" (send_keys) o "script" (una sola llamada por registro)
+    FILL_ENGINE = "teclado"
+    # "navegador" (Selenium) o "http" (envío directo del formulario, sin Chrome)
+    MOTOR = "navegador"
+    # Solo para el motor HTTP: página del formulario (None = la que sigue al login),
+    # plantilla con {fecha} que devuelve las OP de la fecha y envíos simultáneos
+    FORM_URL = None
+    OP_OPTIONS_URL = None
+    HTTP_WORKERS = 4
+    # Motor de navegador: número de sesiones de Chrome simultáneas (1 = una ventana visible)
+    # y campo por el que se reparten los registros entre sesiones
+    SESIONES = 1
+    CLAVE_REPARTO = "fecha"
+    # Inicio rápido del navegador: sin ventana ni imágenes/fuentes/CSS, chromedriver
+    # fijo (None = caché local) y perfil persistente para conservar la sesión del SCP
+    HEADLESS = False
+    RAPIDO = False
+    DRIVER_PATH = None
+    PERFIL = None
+    # Libro de envíos para reanudar sin repetir registros confirmados (None = desactivado)
+    LEDGER = LEDGER_FILE
+    # Validar OP, operario y equipo contra las opciones del formulario antes de enviar
+    PREVALIDAR = True
+    # Modo continuo: vigilar la salida del extractor (directorio o archivo JSONL) y
+    # registrar cada registro nuevo con una sola sesión (None = procesar JSON_FILE)
+    VIGILAR = None
+    COLA_MAXIMA = 100
 
-    automation = FormAutomation()
+    ledger = SubmissionLedger(LEDGER) if LEDGER else None
     try:
-        automation.login(URL, USERNAME, PASSWORD)
-        automation.process_all_records(JSON_FILE, submit_each=True)
-        print("\nProceso completado exitosamente")
-    except Exception as e:
-        print(f"Error durante la ejecución: {e}")
+        if MOTOR == "navegador" and SESIONES > 1:
+            records = load_json_records(JSON_FILE)
+            if records:
+                run_parallel_sessions(
+                    records, URL, USERNAME, PASSWORD, sessions=SESIONES, key=CLAVE_REPARTO,
+                    timeouts=TIMEOUTS, fill_engine=FILL_ENGINE, ledger=ledger,
+                    validate=PREVALIDAR,
+                    browser_options={"fast": RAPIDO, "driver_path": DRIVER_PATH, "profile_dir": PERFIL},
+                )
+            return
+
+        if MOTOR == "http":
+            submitter = HttpFormSubmitter(form_url=FORM_URL, op_options_url=OP_OPTIONS_URL, workers=HTTP_WORKERS)
+            try:
+                if submitter.login(URL, USERNAME, PASSWORD):
+                    submitter.process_all_records(JSON_FILE, ledger=ledger, validate=PREVALIDAR)
+                    print("\nProceso completado exitosamente")
+            except Exception as e:
+                print(f"Error durante la ejecución: {e}")
+            finally:
+                submitter.close()
+            return
+
+        automation = FormAutomation(
+            timeouts=TIMEOUTS, fill_engine=FILL_ENGINE, headless=HEADLESS, fast=RAPIDO,
+            driver_path=DRIVER_PATH, profile_dir=PERFIL,
+        )
+        try:
+            automation.login(URL, USERNAME, PASSWORD)
+            if VIGILAR:
+                watcher = RecordWatcher(VIGILAR, queue_size=COLA_MAXIMA)
+                automation.watch_and_register(watcher, (URL, USERNAME, PASSWORD), ledger=ledger)
+                return
+            automation.process_all_records(JSON_FILE, submit_each=True, ledger=ledger, validate=PREVALIDAR)
+            print("\nProceso completado exitosamente")
+        except Exception as e:
+            print(f"Error durante la ejecución: {e}")
+        finally:
+            time.sleep(5)
+            automation.close()
     finally:
-        time.sleep(5)
-        automation.close()
+        if ledger is not None:
+            print(f"Libro de envíos: {ledger.summary()}")
+            ledger.close()
 
 if __name__ == "__main__":
     main()
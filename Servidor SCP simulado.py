@@ -0,0 +1,306 @@
+import argparse
+import html
+import json
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_OPERARIOS = ["NELSON RANGEL", "CARLOS PEREZ", "JUAN GOMEZ", "MARIA LOPEZ"]
+DEFAULT_EQUIPOS = ["30", "31", "32"]
+DEFAULT_OPS = [7027, 7031, 7045, 7102]
+
+# Las páginas reproducen los nombres de campo y las rutas XPath que usa FormAutomation:
+#   login:     /html/body/form/div[4]/button
+#   menú:      /html/body/aside/div/ul/li[8]/a
+#   reportes:  /html/body/table/tbody/tr[3]/td/div/input[2]
+#   registro:  /html/body/div[3]/table/tbody/tr[3]/td[1]/button   (nuevo registro)
+#              /html/body/div[3]/table/tbody/tr[17]/td/div/input  (adicionar)
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SCP - Acceso</title></head><body>
+<form method="post" action="render.php?frm=acceso.logIn">
+<div><h2>SCP</h2></div>
+<div>Usuario <input type="text" name="txtUsuario"></div>
+<div>Contraseña <input type="password" name="txtPass"></div>
+<div><button type="submit" name="btnIngresar" value="1">Ingresar</button></div>
+</form></body></html>"""
+
+HOME_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SCP</title></head><body>
+<aside><div><ul>
+<li><a href="#">Inicio</a></li><li><a href="#">Órdenes</a></li><li><a href="#">Operarios</a></li>
+<li><a href="#">Equipos</a></li><li><a href="#">Clientes</a></li><li><a href="#">Compras</a></li>
+<li><a href="#">Inventario</a></li><li><a href="render.php?frm=reportes">Reportes</a></li>
+</ul></div></aside></body></html>"""
+
+REPORT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SCP - Reportes</title></head><body>
+<table><tbody>
+<tr><td>Fecha inicial <input type="text" name="txtFechaI"></td></tr>
+<tr><td>Fecha final <input type="text" name="txtFechaF"></td></tr>
+<tr><td><div><input type="button" value="Limpiar">
+<input type="button" value="Reporte" onclick="location.href='render.php?frm=registro'"></div></td></tr>
+</tbody></table></body></html>"""
+
+REGISTRATION_SCRIPT = """
+window.jQuery = {active: 0};
+function byName(name) { return document.getElementsByName(name)[0]; }
+var lastFecha = null;
+function reloadOps() {
+    var fecha = byName('fecha').value;
+    if (fecha === lastFecha) { return; }
+    lastFecha = fecha;
+    jQuery.active++;
+    fetch('render.php?frm=registro.ops&fecha=' + encodeURIComponent(fecha))
+        .then(function (r) { return r.text(); })
+        .then(function (options) { byName('cboOPF').innerHTML = options; })
+        .finally(function () { jQuery.active--; });
+}
+function adicionar() {
+    var data = new URLSearchParams();
+    FIELDS.forEach(function (name) { data.append(name, byName(name).value); });
+    data.append('btnAdicionar', 'Adicionar');
+    jQuery.active++;
+    fetch('render.php?frm=registro', {method: 'POST', body: data})
+        .then(function (r) { return r.json(); })
+        .then(function (res) {
+            if (!res.ok) { alert(res.error); return; }
+            var row = document.createElement('tr');
+            row.innerHTML = '<td>' + res.id + '</td>';
+            document.getElementById('registrados').appendChild(row);
+            byName('txtActividad').value = '';
+        })
+        .finally(function () { jQuery.active--; });
+}
+function nuevoRegistro() { byName('fecha').focus(); }
+byName('fecha').addEventListener('change', reloadOps);
+"""
+
+FIELDS = ["fecha", "cboOPF", "cboOperario", "txtActividad", "txtTiempoOrdinario", "txtTiempoExtra", "cboEquipo"]
+
+
+def options_html(options, placeholder="Seleccione"):
+    """<option> de una lista de pares (valor, texto)"""
+    items = [f'<option value="">{placeholder}</option>']
+    items += [f'<option value="{html.escape(str(v))}">{html.escape(str(t))}</option>' for v, t in options]
+    return "".join(items)
+
+
+class ScpSimulado:
+    def __init__(self, ops=None, operarios=None, equipos=None, ops_by_fecha=None,
+                 latency=0.0, username="admin", password="123"):
+        """
+        Estado en memoria del SCP simulado
+
+        Args:
+            ops (list): Números de OP disponibles para cualquier fecha
+            operarios (list): Nombres de operarios
+            equipos (list): Códigos de equipo
+            ops_by_fecha (dict): OP adicionales por fecha (como en el SCP real,
+                la lista de cboOPF depende de la fecha)
+            latency (float): Espera en segundos antes de cada respuesta
+            username, password (str): Credenciales válidas
+        """
+        self.ops = list(ops or DEFAULT_OPS)
+        self.ops_by_fecha = {fecha: list(values) for fecha, values in (ops_by_fecha or {}).items()}
+        self.operarios = [(str(i), name) for i, name in enumerate(operarios or DEFAULT_OPERARIOS, 1)]
+        self.equipos = [(str(code), f"{code} - EQUIPO {code}") for code in (equipos or DEFAULT_EQUIPOS)]
+        self.latency = latency
+        self.credentials = (username, password)
+        self.sessions = set()
+        self.records = []
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """SCP simulado con las opciones necesarias para registrar `records`"""
+        ops_by_fecha = {}
+        for record in records:
+            ops_by_fecha.setdefault(record["fecha"], set()).add(str(record["OP"]))
+        return cls(
+            ops=[],
+            operarios=sorted({record["operario"] for record in records}),
+            equipos=sorted({str(record["equipo"]) for record in records}),
+            ops_by_fecha={fecha: sorted(ops) for fecha, ops in ops_by_fecha.items()},
+            **kwargs,
+        )
+
+    def op_options(self, fecha):
+        ops = sorted({str(op) for op in self.ops} | set(self.ops_by_fecha.get(fecha, [])))
+        return [(op, f"{op} - ORDEN {op}") for op in ops]
+
+    def registration_page(self):
+        rows = [
+            "<tr><td>Registro de tiempos</td></tr>",
+            "<tr><td></td></tr>",
+            '<tr><td><button type="button" onclick="nuevoRegistro()">Nuevo registro</button></td></tr>',
+            '<tr><td>Fecha <input type="text" name="fecha"></td></tr>',
+            f'<tr><td>OP <select name="cboOPF">{options_html([])}</select></td></tr>',
+            f'<tr><td>Operario <select name="cboOperario">{options_html(self.operarios)}</select></td></tr>',
+            '<tr><td>Actividad <input type="text" name="txtActividad"></td></tr>',
+            '<tr><td>Tiempo ordinario <input type="text" name="txtTiempoOrdinario"></td></tr>',
+            '<tr><td>Tiempo extra <input type="text" name="txtTiempoExtra"></td></tr>',
+            f'<tr><td>Equipo <select name="cboEquipo">{options_html(self.equipos)}</select></td></tr>',
+        ]
+        rows += ["<tr><td></td></tr>"] * (16 - len(rows))
+        rows.append('<tr><td><div><input type="button" name="btnAdicionar" value="Adicionar" onclick="adicionar()"></div></td></tr>')
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>SCP - Registro</title></head><body>'
+            "<div>SCP</div><div>Producción</div>"
+            f"<div><table><tbody>{''.join(rows)}</tbody></table></div>"
+            '<div><table><tbody id="registrados"></tbody></table></div>'
+            f"<script>var FIELDS = {json.dumps(FIELDS)};{REGISTRATION_SCRIPT}</script>"
+            "</body></html>"
+        )
+
+    def add_record(self, data):
+        """
+        Valida y guarda un registro enviado por el formulario
+
+        Returns:
+            dict: {"ok": bool, "id": int} o {"ok": False, "error": str}
+        """
+        fecha = data.get("fecha", "")
+        checks = [
+            ("fecha", bool(fecha)),
+            ("cboOPF", data.get("cboOPF") in {value for value, _ in self.op_options(fecha)}),
+            ("cboOperario", data.get("cboOperario") in {value for value, _ in self.operarios}),
+            ("cboEquipo", data.get("cboEquipo") in {value for value, _ in self.equipos}),
+            ("txtActividad", bool(data.get("txtActividad"))),
+            ("txtTiempoOrdinario", bool(data.get("txtTiempoOrdinario"))),
+        ]
+        invalid = [name for name, ok in checks if not ok]
+        with self._lock:
+            if invalid:
+                self.rejected += 1
+                return {"ok": False, "error": f"Campos no válidos: {', '.join(invalid)}"}
+            self.records.append({name: data.get(name, "") for name in FIELDS})
+            return {"ok": True, "id": len(self.records)}
+
+    def stats(self):
+        with self._lock:
+            return {"registros": len(self.records), "rechazados": self.rejected}
+
+
+def make_handler(scp):
+    """Clase de manejador HTTP ligada a un ScpSimulado"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, body, status=200, content_type="text/html; charset=utf-8", headers=None):
+            if scp.latency:
+                time.sleep(scp.latency)
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _redirect(self, location, headers=None):
+            self._send("", 302, headers=dict(headers or {}, Location=location))
+
+        def _session(self):
+            cookie = self.headers.get("Cookie", "")
+            for part in cookie.split(";"):
+                name, _, value = part.strip().partition("=")
+                if name == "PHPSESSID" and value in scp.sessions:
+                    return value
+            return None
+
+        def _route(self):
+            url = urlparse(self.path)
+            return parse_qs(url.query).get("frm", [""])[0], parse_qs(url.query)
+
+        def do_GET(self):
+            frm, query = self._route()
+            if frm == "estado":
+                return self._send(json.dumps(scp.stats()), content_type="application/json")
+            if not self._session():
+                return self._send(LOGIN_PAGE)
+            if frm == "reportes":
+                return self._send(REPORT_PAGE)
+            if frm == "registro":
+                return self._send(scp.registration_page())
+            if frm == "registro.ops":
+                fecha = query.get("fecha", [""])[0]
+                return self._send(options_html(scp.op_options(fecha)))
+            return self._send(HOME_PAGE)
+
+        def do_POST(self):
+            frm, _ = self._route()
+            length = int(self.headers.get("Content-Length") or 0)
+            data = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+            if frm == "acceso.logIn":
+                if (data.get("txtUsuario"), data.get("txtPass")) != scp.credentials:
+                    return self._send(LOGIN_PAGE)
+                session = secrets.token_hex(16)
+                scp.sessions.add(session)
+                return self._redirect(
+                    "render.php?frm=inicio", {"Set-Cookie": f"PHPSESSID={session}; Path=/"}
+                )
+            if not self._session():
+                return self._send(LOGIN_PAGE)
+            if frm == "registro":
+                result = scp.add_record(data)
+                return self._send(json.dumps(result), 200 if result["ok"] else 400, "application/json")
+            return self._send("", 404)
+
+    return Handler
+
+
+def start_server(scp, host="127.0.0.1", port=0):
+    """
+    Inicia el servidor en un hilo
+
+    Returns:
+        tuple: (servidor, URL de login)
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(scp))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/scp/render.php?frm=acceso.logIn"
+
+
+def parse_args():
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="SCP simulado para pruebas locales del registro")
+    parser.add_argument("--puerto", type=int, default=8181, help="Puerto (por defecto 8181)")
+    parser.add_argument("--latencia", type=float, default=0.0,
+                        help="Espera en milisegundos antes de cada respuesta")
+    parser.add_argument("--registros", metavar="JSON",
+                        help="Tomar OP, operarios y equipos de un JSON del extractor")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    latency = args.latencia / 1000
+    if args.registros:
+        with open(args.registros, 'r', encoding='utf-8') as f:
+            scp = ScpSimulado.from_records(json.load(f), latency=latency)
+    else:
+        scp = ScpSimulado(latency=latency)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.puerto), make_handler(scp))
+    print(f"SCP simulado en http://127.0.0.1:{args.puerto}/scp/render.php?frm=acceso.logIn")
+    print(f"Usuario: {scp.credentials[0]} / Contraseña: {scp.credentials[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Registros recibidos: {scp.stats()}")
+
+
+if __name__ == "__main__":
+    main()